@@ -0,0 +1,257 @@
+import gzip
+import hashlib
+from urllib.parse import urljoin
+from flask import Blueprint, current_app, jsonify, request, url_for, abort
+from sqlalchemy.orm import joinedload, selectinload
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import is_resource_modified
+from models import db, Books, BookStats, Review
+from books import catalog_query
+from pagination import KeysetPagination, cached_count
+from facets import GenrePagination, genre_index
+from refdata import get_genres
+from covers import cover_url
+
+bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Версионированный JSON API только для чтения: каталог, книга, жанры и рецензии.
+# Запросы те же, что у HTML-страниц (catalog_query, KeysetPagination, genre_index).
+# ETag и Last-Modified строятся по books.updated_at и book_stats.updated_at (у списка
+# книг - только ETag, в него входят и id книг страницы), поэтому
+# на повторный запрос с If-None-Match / If-Modified-Since ответ 304 отдается без
+# сборки JSON, а для книги и рецензий - и без загрузки самих данных.
+# Параметр fields=a,b,c оставляет в объектах только перечисленные поля.
+# Ответы больше API_COMPRESS_MIN_SIZE байт сжимаются gzip, если клиент его принимает
+
+MAX_PER_PAGE = 50
+
+BOOK_SUMMARY_FIELDS = ('id_book', 'name_book', 'year', 'genres', 'avg_rating', 'review_count', 'cover_url', 'updated_at')
+BOOK_FIELDS = BOOK_SUMMARY_FIELDS + ('author', 'publisher', 'pages', 'short_description', 'short_description_html')
+REVIEW_FIELDS = ('id_review', 'rating', 'text', 'text_html', 'created_at', 'author')
+
+
+@bp.errorhandler(HTTPException)
+def api_error(e):
+    return jsonify(error=e.name, message=e.description), e.code
+
+
+@bp.after_request
+def compress_response(response):
+    response.vary.add('Accept-Encoding')
+    if (response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or 'gzip' not in request.accept_encodings
+            or (response.content_length or 0) < current_app.config.get('API_COMPRESS_MIN_SIZE', 1024)):
+        return response
+    response.set_data(gzip.compress(response.get_data(), compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+# Поля, запрошенные параметром fields (None - все). Неизвестное поле - ошибка 400
+def requested_fields(allowed):
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        abort(400, f'Unknown fields: {", ".join(unknown)}. Available: {", ".join(allowed)}')
+    return fields
+
+
+def pick(data, fields):
+    return data if fields is None else {field: data[field] for field in fields}
+
+
+def _etag(etag_parts):
+    return hashlib.md5(repr((request.full_path, *etag_parts)).encode()).hexdigest()
+
+
+# Нужен ли клиенту ответ (False - у него актуальная версия, будет 304)
+def is_modified(etag_parts, last_modified):
+    return is_resource_modified(request.environ, etag=_etag(etag_parts), last_modified=last_modified)
+
+
+# Ответ с условным GET. etag_parts - значения, от которых зависит содержимое
+# (время изменения строк, количество); payload вызывается только если клиенту нужен ответ
+def conditional_json(etag_parts, last_modified, payload):
+    etag = _etag(etag_parts)
+    if not is_modified(etag_parts, last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(payload())
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def _cover_url(cover):
+    return urljoin(request.host_url, cover_url(cover)) if cover is not None and cover.md5_hash else None
+
+
+def _page_url(endpoint, args, **values):
+    if args is None:
+        return None
+    return url_for(endpoint, **dict(args, **values), _external=True)
+
+
+def book_summary(row):
+    return {
+        'id_book': row.id_book,
+        'name_book': row.name_book,
+        'year': row.year,
+        'genres': row.genres.split(',') if row.genres else [],
+        'avg_rating': row.avg_rating,
+        'review_count': row.review_count,
+        'cover_url': _cover_url(row),
+        'updated_at': _isoformat(max(row.updated_at, row.stats_updated_at)),
+    }
+
+
+# Список книг каталога: ?genre=1&genre=2&mode=and|or, курсоры after/before как у главной страницы
+@bp.route('/books')
+def books():
+    fields = requested_fields(BOOK_SUMMARY_FIELDS)
+    page = request.args.get('page', 1, type=int)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), MAX_PER_PAGE)
+    selected_genres = request.args.getlist('genre', type=int)
+    mode = 'or' if request.args.get('mode') == 'or' else 'and'
+    books_query = catalog_query()
+
+    cursor_args = dict(
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        skip=request.args.get('skip', 0, type=int),
+        last=request.args.get('last', 0, type=int)
+    )
+    if selected_genres:
+        pagination = GenrePagination(books_query, genre_index.select(selected_genres, mode), page, per_page, **cursor_args)
+    else:
+        total = cached_count('books', db.session.query(BookStats.id_book), current_app.config.get('CATALOG_COUNT_TTL', 60))
+        pagination = KeysetPagination(books_query, [Books.year, Books.id_book], page, per_page, total, **cursor_args)
+    total = pagination.total
+    rows = pagination.items
+    # Только ETag: удаление книги на предыдущей странице сдвигает эту, а время изменения
+    # оставшихся книг не меняется, поэтому Last-Modified для списка не отдается
+    versions = [(row.id_book, row.updated_at, row.stats_updated_at) for row in rows]
+    filters = {'genre': selected_genres, 'mode': mode, 'per_page': per_page}
+    if request.args.get('fields'):
+        filters['fields'] = request.args['fields']
+
+    return conditional_json((total, versions), None, lambda: {
+        'items': [pick(book_summary(row), fields) for row in rows],
+        'page': pagination.page,
+        'pages': pagination.pages,
+        'total': total,
+        'next': _page_url('api.books', pagination.next_args, **filters),
+        'prev': _page_url('api.books', pagination.prev_args, **filters),
+    })
+
+
+def book_details(book, cover, genres, stats):
+    return {
+        'id_book': book.id_book,
+        'name_book': book.name_book,
+        'author': book.author,
+        'publisher': book.publisher,
+        'year': book.year,
+        'pages': book.pages,
+        'short_description': book.short_description,
+        'short_description_html': book.short_description_html,
+        'genres': [{'id_genre': genre.id_genre, 'name_genre': genre.name_genre} for genre in genres],
+        'avg_rating': stats.avg_rating,
+        'review_count': stats.review_count,
+        'cover_url': _cover_url(cover),
+        'updated_at': _isoformat(max(book.updated_at, stats.updated_at)),
+    }
+
+
+def book_version_query(id_book):
+    return (
+        db.select(Books.updated_at, BookStats.updated_at, BookStats.review_count)
+        .join(BookStats, BookStats.id_book == Books.id_book)
+        .filter(Books.id_book == id_book)
+    )
+
+
+# Время изменения книги и ее статистики одним запросом по первичному ключу
+def _book_version(id_book):
+    version = db.session.execute(book_version_query(id_book)).first()
+    if version is None:
+        abort(404, 'Book not found')
+    return version
+
+
+@bp.route('/books/<int:id_book>')
+def book(id_book):
+    fields = requested_fields(BOOK_FIELDS)
+    updated_at, stats_updated_at, review_count = _book_version(id_book)
+
+    def payload():
+        book = db.session.execute(
+            db.select(Books)
+            .options(joinedload(Books.cover), selectinload(Books.genres))
+            .filter_by(id_book=id_book)
+        ).scalar_one()
+        stats = db.session.get(BookStats, id_book)
+        return pick(book_details(book, book.cover, book.genres, stats), fields)
+
+    return conditional_json((updated_at, stats_updated_at, review_count), max(updated_at, stats_updated_at), payload)
+
+
+# Жанры вместе с количеством книг каждого жанра
+@bp.route('/genres')
+def genres():
+    fields = requested_fields(('id_genre', 'name_genre', 'book_count'))
+    counts = genre_index.counts()
+    items = [
+        {'id_genre': genre.id_genre, 'name_genre': genre.name_genre, 'book_count': counts.get(genre.id_genre, 0)}
+        for genre in get_genres()
+    ]
+    return conditional_json((items,), None, lambda: {'items': [pick(item, fields) for item in items]})
+
+
+# Рецензии книги по возрастанию id_review, страница - limit рецензий после ?after=<id_review>
+@bp.route('/books/<int:id_book>/reviews')
+def reviews(id_book):
+    fields = requested_fields(REVIEW_FIELDS)
+    limit = min(max(request.args.get('limit', 20, type=int), 1), MAX_PER_PAGE)
+    after = request.args.get('after', 0, type=int)
+    _, stats_updated_at, review_count = _book_version(id_book)
+
+    def payload():
+        rows = db.session.execute(
+            db.select(Review)
+            .options(joinedload(Review.user))
+            .filter(Review.id_book == id_book, Review.id_review > after)
+            .order_by(Review.id_review)
+            .limit(limit + 1)
+        ).scalars().all()
+        items = [
+            pick({
+                'id_review': review.id_review,
+                'rating': review.rating,
+                'text': review.text,
+                'text_html': review.text_html,
+                'created_at': _isoformat(review.created_at),
+                'author': f'{review.user.lastname} {review.user.name}' if review.user else None,
+            }, fields)
+            for review in rows[:limit]
+        ]
+        next_args = {'after': rows[limit - 1].id_review, 'limit': limit} if len(rows) > limit else None
+        if next_args and request.args.get('fields'):
+            next_args['fields'] = request.args['fields']
+        return {
+            'items': items,
+            'total': review_count,
+            'next': _page_url('api.reviews', next_args, id_book=id_book),
+        }
+
+    return conditional_json((stats_updated_at, review_count), stats_updated_at, payload)
@@ -1,50 +1,123 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, abort, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import current_user, login_required
 from flask_migrate import Migrate
-from models import db, Books, Genres, Review, ConnectGenreBook, Covers 
+from replicas import init_replicas
+from models import db, Books, Review, BookStats
 from auth import bp as auth_bp, init_login_manager
-from books import bp as books_bp
-from sqlalchemy import func
+from books import bp as books_bp, admin_or_moderator, catalog_query
+from stats import add_review_rating
+from markup import render_markdown
+from commands import init_commands
+from covers import bp as covers_bp, init_covers
+from exports import bp as exports_bp
+from api import bp as api_bp
+from instrumentation import init_instrumentation
+from profiling import bp as profiles_bp, init_profiling
+from async_views import init_async_views
+from pagination import KeysetPagination, OffsetPagination, cached_count
+from search import apply_search
+from facets import GenrePagination, genre_index, init_facets
+from rankings import rankings, init_rankings
+from refdata import init_refdata, get_genres
+from page_cache import init_page_cache, cached_page, tag_page, invalidate, cache as page_cache
 import bleach
-import markdown
 
 app = Flask(__name__)
 application = app
 app.config.from_pyfile('config.py')
+# Переменные окружения FLASK_<KEY> переопределяют config.py (используется бенчмарками)
+app.config.from_prefixed_env()
+# Запросы, тело которых заметно больше допустимой обложки, отклоняются (413) еще до разбора формы
+# (в конфигурации Flask по умолчанию MAX_CONTENT_LENGTH = None, поэтому setdefault не подходит)
+if app.config.get('MAX_CONTENT_LENGTH') is None:
+    app.config['MAX_CONTENT_LENGTH'] = app.config.get('MAX_COVER_SIZE', 10 * 1024 * 1024) + 1024 * 1024
 
+init_replicas(app)
 db.init_app(app)
 migrate = Migrate(app, db)
 
 init_login_manager(app)
+init_page_cache(app)
+init_commands(app)
+init_covers(app)
+init_facets(app)
+init_rankings(app)
+init_refdata(app)
+init_instrumentation(app)
+init_profiling(app)
 
 app.register_blueprint(auth_bp)
 app.register_blueprint(books_bp)
+app.register_blueprint(covers_bp)
+app.register_blueprint(exports_bp)
+app.register_blueprint(api_bp)
+app.register_blueprint(profiles_bp)
+init_async_views(app)
 
 # Главная страница с пагинацией
 @app.route('/')
+@cached_page(lambda: ['catalog'])
 def index():
     page = request.args.get('page', 1, type=int)
-    books_query = (
-        db.session.query(
-            Books.id_book,
-            Books.name_book,
-            func.group_concat(Genres.name_genre.distinct()).label('genres'),
-            Books.year,
-            func.round(func.avg(Review.rating), 1).label('avg_rating'),
-            func.count(Review.id_review.distinct()).label('review_count'),
-            Covers.filename,
-            Covers.mimetype
-        )
-        .join(ConnectGenreBook, ConnectGenreBook.id_book == Books.id_book)
-        .join(Genres, Genres.id_genre == ConnectGenreBook.id_genre)
-        .outerjoin(Review, Review.id_book == Books.id_book)
-        .outerjoin(Covers, Covers.id_cover == Books.id_cover)
-        .group_by(Books.id_book, Books.name_book, Books.year, Covers.filename) 
-        .order_by(Books.year.desc())
+    selected_genres = request.args.getlist('genre', type=int)
+    mode = 'or' if request.args.get('mode') == 'or' else 'and'
+    books_query = catalog_query()
+
+    # Фильтр по жанрам и количество книг по жанрам считаются по битовым маскам
+    # из genre_index, без JOIN с connect_genre_book. Страница отфильтрованного
+    # каталога выбирается в памяти, из базы читаются только ее книги
+    cursor_args = dict(
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        skip=request.args.get('skip', 0, type=int),
+        last=request.args.get('last', 0, type=int)
     )
-    pagination = books_query.paginate(per_page=9, page=page)
+    if selected_genres:
+        selected = genre_index.select(selected_genres, mode)
+        facet_counts = genre_index.counts(selected if mode == 'and' else None)
+        pagination = GenrePagination(books_query, selected, page, 9, **cursor_args)
+    else:
+        # Общее количество книг берется из кэша
+        total = cached_count('books', db.session.query(BookStats.id_book), app.config.get('CATALOG_COUNT_TTL', 60))
+        facet_counts = genre_index.counts()
+        # Пагинация по ключу (year, id_book) вместо OFFSET
+        pagination = KeysetPagination(books_query, [Books.year, Books.id_book], page, 9, total, **cursor_args)
     books = pagination.items
-    return render_template("index.html", books=books, pagination=pagination)
+    # Страница каталога сбрасывается из кэша при изменении любой книги на ней
+    tag_page(*[f'book:{book.id_book}' for book in books])
+    genres = get_genres()
+    return render_template("index.html", books=books, pagination=pagination, genres=genres,
+                           facet_counts=facet_counts, selected_genres=selected_genres, mode=mode)
+
+# Рейтинги книг: первые книги берутся из готовых рейтингов (rankings.py),
+# карточки - одним запросом по первичному ключу и выводятся в порядке рейтинга
+RANKING_TITLES = {
+    'rating': 'Лучшие книги',
+    'reviews': 'Самые обсуждаемые',
+    'trending': 'Популярные сейчас',
+}
+
+@app.route('/rankings/<kind>')
+def ranking(kind):
+    if kind not in RANKING_TITLES:
+        abort(404)
+    top = rankings.top(kind, app.config.get('RANKING_PAGE_SIZE', 30))
+    ids = [id_book for id_book, _ in top]
+    cards = {book.id_book: book for book in catalog_query().filter(Books.id_book.in_(ids))} if ids else {}
+    books = [cards[id_book] for id_book in ids if id_book in cards]
+    return render_template('rankings.html', books=books, kind=kind, titles=RANKING_TITLES,
+                           trending_days=rankings.trending_days)
+
+# Полнотекстовый поиск по каталогу
+@app.route('/search')
+def search():
+    query = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    books_query = apply_search(catalog_query(), query) if query else None
+    if books_query is None:
+        return render_template('search.html', books=[], pagination=None, query=query)
+    pagination = OffsetPagination(books_query, page, 9)
+    return render_template('search.html', books=pagination.items, pagination=pagination, query=query)
 
 # Написать рецензию
 @app.route('/write_review/<int:id_book>', methods=['GET', 'POST'])
@@ -63,12 +136,21 @@ def write_review(id_book):
         
         sanitized_text = bleach.clean(text)
         
-        review = Review(rating=rating, text=sanitized_text, id_book=id_book, id_user=current_user.id_user)
+        review = Review(rating=rating, text=sanitized_text, text_html=render_markdown(sanitized_text), id_book=id_book, id_user=current_user.id_user)
         db.session.add(review)
+        add_review_rating(id_book, int(rating))
         db.session.commit()
+        invalidate(f'book:{id_book}')
+        rankings.add_review(id_book, int(rating))
         
         flash('Рецензия успешно добавлена!', 'success')
         return redirect(url_for('books.view_books', id_book=id_book))
     
     return render_template('write_review.html', book=book)
 
+# Счетчики кэша страниц
+@app.route('/cache_stats')
+@login_required
+@admin_or_moderator('admin')
+def cache_stats():
+    return jsonify(page_cache.stats())
@@ -0,0 +1,102 @@
+import asyncio
+import contextvars
+import importlib.util
+import logging
+import os
+from threading import Lock, Thread
+from sqlalchemy.engine import make_url
+
+try:
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+except ImportError:
+    create_async_engine = None
+
+# asgiref нужен Flask для выполнения async-view, сам модуль здесь не импортируется
+if importlib.util.find_spec('asgiref') is None:
+    create_async_engine = None
+
+logger = logging.getLogger(__name__)
+
+# Асинхронный доступ к базе для страниц и API только для чтения (см. async_views.py).
+# Все асинхронные запросы выполняются в одном фоновом цикле событий со своим пулом
+# соединений: Flask запускает каждую async-view в отдельном цикле, а соединения
+# asyncio-драйверов привязаны к циклу, в котором созданы. View ждет результат через
+# run(), и независимые запросы одной страницы выполняются параллельно (asyncio.gather).
+# Адрес базы - ASYNC_DATABASE_URI, по умолчанию SQLALCHEMY_DATABASE_URI с асинхронным
+# драйвером (sqlite -> aiosqlite, mysql -> aiomysql). Нужны пакеты asgiref и драйвер
+# (все указаны в req.txt); без них асинхронный режим не включается, о чем пишется в журнал
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'mysql': 'mysql+aiomysql',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+
+def async_database_uri(uri):
+    url = make_url(uri)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername)).render_as_string(hide_password=False)
+
+
+class AsyncDatabase:
+    def __init__(self):
+        self.uri = None
+        self.engine_options = {}
+        self._loop = None
+        self._pid = None
+        self._sessionmaker = None
+        self._lock = Lock()
+
+    @property
+    def enabled(self):
+        return self.uri is not None
+
+    # Цикл событий и движок создаются при первом обращении в процессе
+    # (в том числе заново после fork воркера)
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            loop = asyncio.new_event_loop()
+            Thread(target=loop.run_forever, name='async-db', daemon=True).start()
+            engine = create_async_engine(self.uri, **self.engine_options)
+            self._sessionmaker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+            self._loop = loop
+            self._pid = os.getpid()
+
+    def session(self):
+        return self._sessionmaker()
+
+    # Выполнение корутины в цикле базы; результат можно ждать из любого цикла.
+    # Корутина получает копию контекста вызывающего кода, поэтому в ней доступны
+    # контекст запроса и g (учет запросов в instrumentation.py)
+    def run(self, coro):
+        self._start()
+        context = contextvars.copy_context()
+        return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._in_context(coro, context), self._loop))
+
+    @staticmethod
+    async def _in_context(coro, context):
+        return await asyncio.get_running_loop().create_task(coro, context=context)
+
+    # Выполнение функции func(session) в отдельной сессии (отдельном соединении)
+    async def read(self, func):
+        async with self.session() as session:
+            return await func(session)
+
+
+async_db = AsyncDatabase()
+
+
+def init_async_db(app):
+    if not app.config.get('ASYNC_DATABASE', False):
+        return False
+    if create_async_engine is None:
+        logger.warning('ASYNC_DATABASE is enabled, but asgiref or sqlalchemy asyncio support is not installed')
+        return False
+    async_db.uri = app.config.get('ASYNC_DATABASE_URI') or async_database_uri(app.config['SQLALCHEMY_DATABASE_URI'])
+    async_db.engine_options = {
+        key: value for key, value in app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}).items()
+        if key in ('pool_size', 'max_overflow', 'pool_timeout', 'pool_recycle', 'pool_pre_ping')
+    }
+    return True
@@ -0,0 +1,115 @@
+import asyncio
+from flask import Blueprint, abort, render_template
+from flask_login import current_user
+from sqlalchemy import select
+from models import Books, BookStats, Covers, Genres, ConnectGenreBook
+from async_db import async_db, init_async_db
+from page_cache import cached_page
+from books import reviews_page_query, reviews_per_page, split_reviews_page, user_review_query
+from api import BOOK_FIELDS, book_details, book_version_query, conditional_json, is_modified, pick, requested_fields
+
+bp = Blueprint('async_views', __name__, url_prefix='/async')
+
+# Асинхронные версии страницы книги и книги в API. Независимые запросы (книга,
+# обложка, жанры, первая страница рецензий, рецензия пользователя) выполняются
+# одновременно в отдельных соединениях. Включаются параметром ASYNC_DATABASE и доступны с префиксом /async для сравнения
+# с синхронными (benchmarks/routes.py, сценарии *_async); с ASYNC_VIEWS = True
+# они же обслуживают основные адреса books.view_books и api.book
+
+
+def _book(id_book):
+    async def read(session):
+        return (await session.execute(select(Books).filter_by(id_book=id_book))).scalar_one_or_none()
+    return read
+
+
+def _cover(id_book):
+    async def read(session):
+        return (await session.execute(
+            select(Covers).join(Books, Books.id_cover == Covers.id_cover).filter(Books.id_book == id_book)
+        )).scalar_one_or_none()
+    return read
+
+
+def _genres(id_book):
+    async def read(session):
+        return (await session.execute(
+            select(Genres)
+            .join(ConnectGenreBook, ConnectGenreBook.id_genre == Genres.id_genre)
+            .filter(ConnectGenreBook.id_book == id_book)
+            .order_by(Genres.id_genre)
+        )).scalars().all()
+    return read
+
+
+def _all(statement):
+    async def read(session):
+        return (await session.execute(statement)).scalars().all()
+    return read
+
+
+def _scalar(statement):
+    async def read(session):
+        return (await session.execute(statement)).scalar()
+    return read
+
+
+def _stats(id_book):
+    async def read(session):
+        return await session.get(BookStats, id_book)
+    return read
+
+
+def _first(statement):
+    async def read(session):
+        return (await session.execute(statement)).first()
+    return read
+
+
+async def _gather(*reads):
+    return await asyncio.gather(*(async_db.read(read) for read in reads))
+
+
+@bp.route('/books/view_books/<int:id_book>')
+@cached_page(lambda id_book: [f'book:{id_book}'], per_user=True)
+async def view_books(id_book):
+    limit = reviews_per_page()
+    reads = [_book(id_book), _cover(id_book), _genres(id_book), _all(reviews_page_query(id_book, None, limit))]
+    if current_user.is_authenticated:
+        reads.append(_scalar(user_review_query(id_book, current_user.id_user)))
+    book, cover, genres, rows, *user_review = await async_db.run(_gather(*reads))
+    if book is None:
+        abort(404)
+    reviews, next_cursor = split_reviews_page(rows, limit)
+
+    return render_template('books/view_books.html', book=book, reviews=reviews, next_cursor=next_cursor,
+                           genres=", ".join(genre.name_genre for genre in genres),
+                           cover_data=cover, user_review=user_review[0] if user_review else None)
+
+
+@bp.route('/api/v1/books/<int:id_book>')
+async def api_book(id_book):
+    fields = requested_fields(BOOK_FIELDS)
+    version = await async_db.run(async_db.read(_first(book_version_query(id_book))))
+    if version is None:
+        abort(404, 'Book not found')
+    etag_parts = tuple(version)
+    last_modified = max(version[0], version[1])
+
+    data = None
+    if is_modified(etag_parts, last_modified):
+        book, cover, genres, stats = await async_db.run(
+            _gather(_book(id_book), _cover(id_book), _genres(id_book), _stats(id_book))
+        )
+        data = pick(book_details(book, cover, genres, stats), fields)
+    return conditional_json(etag_parts, last_modified, lambda: data)
+
+
+# Вызывается после регистрации остальных blueprints
+def init_async_views(app):
+    if not init_async_db(app):
+        return
+    app.register_blueprint(bp)
+    if app.config.get('ASYNC_VIEWS', False):
+        app.view_functions['books.view_books'] = view_books
+        app.view_functions['api.book'] = api_book
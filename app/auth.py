@@ -1,7 +1,12 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
-from flask_login import LoginManager, login_user, logout_user, login_required
-from models import db, Users
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from flask_login import LoginManager, login_user, logout_user, login_required, UserMixin
+from models import db, Users, RoleMixin
+from passwords import PasswordServiceBusy, needs_rehash
+from refdata import bump_version, read_version
+from sqlalchemy import event
 from sqlalchemy.exc import SQLAlchemyError
+from threading import Lock
+import time
 
 user=Users()
 
@@ -15,9 +20,80 @@ def init_login_manager(app):
     login_manager.user_loader(load_user)
     login_manager.init_app(app)
 
+# Снимок пользователя для current_user: только то, что нужно шаблонам и проверкам доступа
+class SessionUser(UserMixin, RoleMixin):
+    def __init__(self, id_user, name, lastname, id_role):
+        self.id_user = id_user
+        self.name = name
+        self.lastname = lastname
+        self.id_role = id_role
+
+    def get_id(self):
+        return str(self.id_user)
+
+
+# Кэш загруженных пользователей (id -> снимок) со сроком жизни USER_CACHE_TTL секунд,
+# чтобы аутентифицированные запросы не обращались к базе за пользователем.
+# Изменение или удаление пользователя через ORM (смена роли, пароля) увеличивает
+# версию 'users' в cache_versions в той же транзакции и сразу удаляет его из кэша
+# этого процесса. Каждый процесс сверяет версию не чаще раза в USER_CACHE_CHECK_INTERVAL
+# секунд и не использует снимки, загруженные до ее изменения, поэтому изменение
+# действует во всех воркерах не позже чем через этот интервал
+_user_cache = {}
+_user_cache_lock = Lock()
+_user_version = {'version': None, 'checked_at': 0}
+USER_CACHE_SIZE = 10000
+USERS_VERSION = 'users'
+
+
+def invalidate_user(user_id):
+    with _user_cache_lock:
+        _user_cache.pop(str(user_id), None)
+
+
+# Версия пользователей, известная процессу; при смене версии кэш очищается
+def _users_version(now):
+    with _user_cache_lock:
+        if now - _user_version['checked_at'] < current_app.config.get('USER_CACHE_CHECK_INTERVAL', 1):
+            return _user_version['version']
+    version = read_version(USERS_VERSION)
+    with _user_cache_lock:
+        if version != _user_version['version']:
+            _user_cache.clear()
+            _user_version['version'] = version
+        _user_version['checked_at'] = now
+        return version
+
+
 def load_user(user_id):
-    user = db.session.execute(db.select(Users).filter_by(id_user=user_id)).scalar_one()
-    return user
+    now = time.monotonic()
+    version = _users_version(now)
+    with _user_cache_lock:
+        cached = _user_cache.get(user_id)
+    if cached and cached[1] > now and cached[2] == version:
+        return SessionUser(*cached[0])
+
+    row = db.session.execute(
+        db.select(Users.id_user, Users.name, Users.lastname, Users.id_role).filter_by(id_user=user_id)
+    ).one_or_none()
+    if row is None:
+        # Пользователь удален - сессия становится анонимной
+        invalidate_user(user_id)
+        return None
+
+    identity = tuple(row)
+    with _user_cache_lock:
+        if len(_user_cache) >= USER_CACHE_SIZE:
+            _user_cache.clear()
+        _user_cache[user_id] = (identity, now + current_app.config.get('USER_CACHE_TTL', 60), version)
+    return SessionUser(*identity)
+
+
+@event.listens_for(Users, 'after_update')
+@event.listens_for(Users, 'after_delete')
+def _user_changed(mapper, connection, target):
+    bump_version(connection, USERS_VERSION)
+    invalidate_user(target.id_user)
 
 # Аутентификация
 @bp.route('/login', methods=['GET', 'POST'])
@@ -27,7 +103,16 @@ def login():
         password = request.form.get('password')
         if login and password:
             user = db.session.execute(db.select(Users).filter_by(login=login)).scalar_one_or_none()
-            if user and user.check_password(password):
+            try:
+                authenticated = user is not None and user.check_password(password)
+                # Хеш, созданный со старыми параметрами, пересчитывается при успешном входе
+                if authenticated and needs_rehash(user.hash_pass):
+                    user.set_password(password)
+                    db.session.commit()
+            except PasswordServiceBusy:
+                flash('Сервер перегружен, попробуйте войти немного позже', 'danger')
+                return render_template('login.html'), 503
+            if authenticated:
                 login_user(user)
                 flash('Вы успешно аутентифицированы.', 'success')
                 next = request.args.get('next')
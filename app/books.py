@@ -1,14 +1,27 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import current_user, login_required
 from functools import wraps
-from models import db, Books, Users, Genres, Review, ConnectGenreBook, Covers 
+from models import db, Books, Review, ConnectGenreBook, Covers, BookStats
+from sqlalchemy import and_, or_
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload, selectinload
+from stats import create_book_stats, update_book_genres, delete_book_stats
+from pagination import invalidate_count, encode_cursor, decode_cursor
+from page_cache import cached_page, invalidate
+from markup import render_markdown
+from covers import schedule_derivatives, schedule_cover_gc
+from cover_storage import cover_key, cover_storage
+from search import index_book, remove_book
+from facets import genre_index
+from rankings import rankings
+from refdata import get_genres
 import os
 from flask import current_app
 from werkzeug.utils import secure_filename
 import bleach
 import hashlib
-import markdown
+import tempfile
+from datetime import datetime, timedelta
 
 
 bp = Blueprint('books', __name__, url_prefix='/books')
@@ -19,6 +32,44 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# Сигнатуры (первые байты файла) допустимых форматов изображений
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+CHUNK_SIZE = 64 * 1024
+
+# Тип изображения по заголовку файла, None если формат не поддерживается
+def detect_image_type(header):
+    for signature, image_type in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return image_type
+    return None
+
+
+# Запрос карточек каталога. Рейтинг, количество рецензий и жанры берутся из book_stats,
+# поэтому здесь нет агрегации по таблице рецензий
+def catalog_query():
+    return (
+        db.session.query(
+            Books.id_book,
+            Books.name_book,
+            BookStats.genres,
+            Books.year,
+            BookStats.avg_rating,
+            BookStats.review_count,
+            Covers.mimetype,
+            Covers.md5_hash,
+            Books.updated_at,
+            BookStats.updated_at.label('stats_updated_at')
+        )
+        .join(BookStats, BookStats.id_book == Books.id_book)
+        .outerjoin(Covers, Covers.id_cover == Books.id_cover)
+    )
+
 
 # Декоратор для разграничения прав доступа, на вход подается 
 # либо 'admin'(доступ только для админа) либо 'admin_moderator' (доступ для админа и библиотекаря)
@@ -37,38 +88,84 @@ def admin_or_moderator(role):
     return decorator
 
 
-# Сохрание обложки в таблицу covers
+# Размер в байтах для сообщений: в МБ, а меньше мегабайта - в КБ
+def format_size(size):
+    if size >= 1024 * 1024:
+        return f'{size / (1024 * 1024):g} МБ'
+    return f'{size / 1024:g} КБ'
+
+
+# Сохрание обложки в таблицу covers. Файл читается из потока порциями по CHUNK_SIZE байт
+# во временный файл хранилища обложек, хеш считается по ходу чтения, поэтому загрузка
+# целиком в память не попадает. Возвращает id обложки, путь к временному файлу, хеш и тип;
+# временный файл переносится в хранилище функцией commit_cover_file только после commit
 def save_cover_file(file):
     filename = secure_filename(file.filename)
     if not allowed_file(filename):
         raise ValueError("Недопустимый формат файла")
-    
-    file_data = file.read()
-    md5_hash = hashlib.md5(file_data).hexdigest()
-    mimetype = filename.rsplit('.', 1)[1].lower()
-    
+
+    max_size = current_app.config.get('MAX_COVER_SIZE', 10 * 1024 * 1024)
+    md5 = hashlib.md5()
+    size = 0
+    mimetype = None
+
+    upload_dir = cover_storage().upload_dir
+    if upload_dir:
+        os.makedirs(upload_dir, exist_ok=True)
+    tmp = tempfile.NamedTemporaryFile(dir=upload_dir, suffix='.upload', delete=False)
+    try:
+        with tmp:
+            while True:
+                chunk = file.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if mimetype is None:
+                    mimetype = detect_image_type(chunk)
+                    if mimetype is None:
+                        raise ValueError("Файл не является изображением допустимого формата")
+                size += len(chunk)
+                if size > max_size:
+                    raise ValueError(f"Размер обложки не должен превышать {format_size(max_size)}")
+                md5.update(chunk)
+                tmp.write(chunk)
+        if mimetype is None:
+            raise ValueError("Файл обложки пуст")
+    except Exception:
+        os.remove(tmp.name)
+        raise
+
+    md5_hash = md5.hexdigest()
+
     # Запрос к базе данных, который проверяет, существует ли уже облажка с таким же хешем
-    # Если существует, то мы используем уже имеющуюся обложку из базы данных
-    existing_cover = db.session.query(Covers).filter_by(md5_hash=md5_hash).first()
+    # Если существует, то мы используем уже имеющуюся обложку из базы данных.
+    # Строка блокируется до commit, чтобы очистка обложек (covers.py) не удалила ее
+    existing_cover = db.session.query(Covers).filter_by(md5_hash=md5_hash).with_for_update().first()
     if existing_cover:
-        return existing_cover.id_cover, None, None
-    
-    # Запрос к таблице covers, filename должно быть обязательно заполнено, поэтому присваиваем 
-    # значение хэша. Здесь используется flush, он позволяет записывать данные в базу данных, 
-    # но не фиксировать их, транзакция остается открытой до вызова commit. Это нужно чтобы получить 
-    # id обложки и записать filename 
-    new_cover = Covers(md5_hash=md5_hash, mimetype=mimetype, filename=f'{md5_hash}')
+        os.remove(tmp.name)
+        return existing_cover.id_cover, None, None, None
+
+    # Запрос к таблице covers. Файл в хранилище адресуется хешем, filename обязательно
+    # заполнено и тоже равно хешу (имя <id_cover> было только у старой плоской раскладки).
+    # Здесь используется flush, он позволяет записывать данные в базу данных,
+    # но не фиксировать их, транзакция остается открытой до вызова commit. Это нужно чтобы получить
+    # id обложки
+    new_cover = Covers(md5_hash=md5_hash, mimetype=mimetype, filename=md5_hash)
     db.session.add(new_cover)
     db.session.flush()
 
-    cover_id = new_cover.id_cover
-    new_cover.filename = f'{cover_id}'
+    return new_cover.id_cover, tmp.name, md5_hash, mimetype
 
-    db.session.commit()
 
-    file.seek(0)
+# Атомарный перенос временного файла обложки в хранилище (после commit)
+def commit_cover_file(tmp_path, md5_hash, mimetype):
+    key = cover_key(md5_hash, mimetype)
+    cover_storage().put_file(key, tmp_path)
+    return key
 
-    return cover_id, file_data, mimetype
+
+def discard_cover_file(tmp_path):
+    if tmp_path and os.path.exists(tmp_path):
+        os.remove(tmp_path)
 
 # Добавление новой книги
 @bp.route('/new_books', methods=['GET', 'POST'])
@@ -76,6 +173,7 @@ def save_cover_file(file):
 @admin_or_moderator('admin')
 def new_books():
     if request.method == 'POST':
+        cover_tmp_path = None
         try:
             name_book = request.form['name_book']
             year = request.form['year']
@@ -87,7 +185,7 @@ def new_books():
 
             cover_file = request.files['cover']
             if cover_file and cover_file.filename != '':
-                cover_id, cover_data, mimetype = save_cover_file(cover_file)
+                cover_id, cover_tmp_path, md5_hash, mimetype = save_cover_file(cover_file)
             else:
                 cover_id = None
             
@@ -97,23 +195,30 @@ def new_books():
                 name_book=name_book, 
                 year=year, 
                 short_description=short_description_html, 
+                short_description_html=render_markdown(short_description_html),
                 publisher=publisher, 
                 author=author, 
                 pages=pages, 
                 id_cover=cover_id
             )
             db.session.add(new_book)
-            db.session.commit()
+            db.session.flush()
 
             for id_genre in selected_genre_ids:
                 connect = ConnectGenreBook(id_book=new_book.id_book, id_genre=int(id_genre))
                 db.session.add(connect)
-            
+
+            create_book_stats(new_book.id_book, [int(id_genre) for id_genre in selected_genre_ids])
+            index_book(new_book)
             db.session.commit()
+            invalidate_count('books')
+            invalidate('catalog')
+            genre_index.set_book(new_book.id_book, new_book.year, [int(id_genre) for id_genre in selected_genre_ids])
 
-            if cover_data:
-                cover_path = os.path.join('static/images', f'{cover_id}.{mimetype}')
-                cover_file.save(cover_path)
+            if cover_tmp_path:
+                commit_cover_file(cover_tmp_path, md5_hash, mimetype)
+                cover_tmp_path = None
+                schedule_derivatives(md5_hash, mimetype)
 
             flash('Книга успешно добавлена!', 'success')
             return redirect(url_for('books.view_books', id_book=new_book.id_book))
@@ -121,9 +226,12 @@ def new_books():
             db.session.rollback()
             flash('При сохранении данных возникла ошибка. Проверьте корректность введённых данных.', 'danger')
         except ValueError as e:
+            db.session.rollback()
             flash(str(e), 'danger')
+        finally:
+            discard_cover_file(cover_tmp_path)
 
-    genres = db.session.query(Genres).all()
+    genres = get_genres()
     return render_template('books/new_books.html', genres=genres)
 
 # Редактирование книги
@@ -139,47 +247,112 @@ def edit_books(id_book):
             book.year = request.form['year']
             short_description = request.form['short_description']
             book.short_description = bleach.clean(short_description)
+            book.short_description_html = render_markdown(book.short_description)
 
             selected_genre_ids = request.form.getlist('genres')
             db.session.query(ConnectGenreBook).filter(ConnectGenreBook.id_book == id_book).delete()
             for id_genre in selected_genre_ids:
                 connect = ConnectGenreBook(id_book=id_book, id_genre=int(id_genre))
                 db.session.add(connect)
+            update_book_genres(id_book, [int(id_genre) for id_genre in selected_genre_ids])
+            index_book(book)
 
             db.session.commit()
+            invalidate('catalog', f'book:{id_book}')
+            genre_index.set_book(id_book, book.year, [int(id_genre) for id_genre in selected_genre_ids])
             flash('Книга успешно обновлена!', 'success')
             return redirect(url_for('books.view_books', id_book=id_book))
         except SQLAlchemyError as e:
             db.session.rollback()
             flash('При сохранении данных возникла ошибка. Проверьте корректность введённых данных.', 'danger')
     
-    genres = db.session.query(Genres).all()
+    genres = get_genres()
     book_genres = [cg.id_genre for cg in db.session.query(ConnectGenreBook).filter_by(id_book=id_book).all()]
     return render_template('books/edit_books.html', book=book, genres=genres, book_genres=book_genres)
 
-# Страница просмотра
-@bp.route('/view_books/<int:id_book>')
-def view_books(id_book):
-    book = db.session.query(Books).get_or_404(id_book)
-    reviews = db.session.query(Review).filter_by(id_book=id_book).all()
-    
-    book.short_description = markdown.markdown(book.short_description)
+# Рецензии книги выводятся страницами по REVIEWS_PER_PAGE, от старых к новым, с
+# пагинацией по ключу (created_at, id_review): следующая страница - рецензии после
+# последней показанной, это просмотр диапазона индекса ix_reviews_id_book_created_at
+# без OFFSET. Курсор - время создания в микросекундах и id_review
+REVIEW_EPOCH = datetime(1970, 1, 1)
+
+
+def review_cursor(review):
+    return encode_cursor([(review.created_at - REVIEW_EPOCH) // timedelta(microseconds=1), review.id_review])
+
+
+# Запрос страницы рецензий: limit + 1 строк, лишняя строка показывает, что есть продолжение
+def reviews_page_query(id_book, after, limit):
+    query = (
+        db.select(Review)
+        .options(joinedload(Review.user))
+        .filter(Review.id_book == id_book)
+        .order_by(Review.created_at, Review.id_review)
+        .limit(limit + 1)
+    )
+    cursor = decode_cursor(after, 2)
+    if cursor:
+        created_at = REVIEW_EPOCH + timedelta(microseconds=cursor[0])
+        query = query.filter(
+            Review.created_at >= created_at,
+            or_(Review.created_at > created_at, and_(Review.created_at == created_at, Review.id_review > cursor[1]))
+        )
+    return query
 
-    genre_ids = db.session.query(ConnectGenreBook.id_genre).filter_by(id_book=id_book).all()
-    genres = db.session.query(Genres.name_genre).filter(Genres.id_genre.in_([id[0] for id in genre_ids])).all()
-    genres = ", ".join([genre.name_genre for genre in genres])
 
-    cover_data = db.session.query(Covers.filename, Covers.mimetype).filter_by(id_cover=book.id_cover).first()
+# Рецензии страницы и курсор следующей (None, если страница последняя)
+def split_reviews_page(rows, limit):
+    if len(rows) > limit:
+        return rows[:limit], review_cursor(rows[limit - 1])
+    return rows, None
 
-    for review in reviews:
-        user = db.session.query(Users).filter_by(id_user=review.id_user).first()
-        review.username = f"{user.lastname} {user.name}" if user else "Unknown"
 
-    user_review = db.session.query(Review).filter_by(id_book=id_book, id_user=current_user.id_user).first() if current_user.is_authenticated else None
-    if user_review:
-        user_review.text = markdown.markdown(user_review.text)
+def reviews_per_page():
+    return current_app.config.get('REVIEWS_PER_PAGE', 20)
 
-    return render_template('books/view_books.html', book=book, reviews=reviews, genres=genres, cover_data=cover_data, user_review=user_review)
+
+def user_review_query(id_book, id_user):
+    return db.select(Review).filter_by(id_book=id_book, id_user=id_user).limit(1)
+
+
+# Страница просмотра
+@bp.route('/view_books/<int:id_book>')
+@cached_page(lambda id_book: [f'book:{id_book}'], per_user=True)
+def view_books(id_book):
+    # Книга вместе с обложкой (JOIN) и жанрами (один SELECT ... IN), первая страница
+    # рецензий вместе с авторами и рецензия текущего пользователя отдельным запросом,
+    # поэтому число запросов и размер страницы не зависят от числа рецензий
+    book = db.first_or_404(
+        db.select(Books)
+        .options(joinedload(Books.cover), selectinload(Books.genres))
+        .filter_by(id_book=id_book)
+    )
+    limit = reviews_per_page()
+    reviews, next_cursor = split_reviews_page(
+        db.session.execute(reviews_page_query(id_book, None, limit)).scalars().all(), limit
+    )
+
+    genres = ", ".join([genre.name_genre for genre in book.genres])
+    cover_data = book.cover
+
+    user_review = None
+    if current_user.is_authenticated:
+        user_review = db.session.execute(user_review_query(id_book, current_user.id_user)).scalar()
+
+    return render_template('books/view_books.html', book=book, reviews=reviews, next_cursor=next_cursor,
+                           genres=genres, cover_data=cover_data, user_review=user_review)
+
+
+# Следующая страница рецензий фрагментом HTML для подгрузки на странице книги
+# (static/reviews.js); ссылка на продолжение входит во фрагмент
+@bp.route('/view_books/<int:id_book>/reviews')
+@cached_page(lambda id_book: [f'book:{id_book}'])
+def reviews_page(id_book):
+    limit = reviews_per_page()
+    reviews, next_cursor = split_reviews_page(
+        db.session.execute(reviews_page_query(id_book, request.args.get('after'), limit)).scalars().all(), limit
+    )
+    return render_template('books/reviews_page.html', book_id=id_book, reviews=reviews, next_cursor=next_cursor)
 
 # Удаление книги
 @bp.route('<int:id_book>/delete_book', methods=['POST'])
@@ -187,21 +360,19 @@ def view_books(id_book):
 @admin_or_moderator('admin_moderator')
 def delete_book(id_book):
     book = db.session.query(Books).get_or_404(id_book)
-    id_cover = book.id_cover
 
     try:
+        delete_book_stats(id_book)
+        remove_book(id_book)
         db.session.delete(book)
         db.session.commit()
-
-        if id_cover:
-            cover = db.session.query(Covers).get(book.id_cover)
-            if cover and cover.filename:
-                cover_path = os.path.join('static/images', f'{cover.filename}.{cover.mimetype}')
-                if os.path.exists(cover_path):
-                    os.remove(cover_path)
-                db.session.delete(cover)
-                print("path***", cover_path)
-            db.session.commit()
+        invalidate_count('books')
+        invalidate('catalog', f'book:{id_book}')
+        genre_index.remove_book(id_book)
+        rankings.remove_book(id_book)
+        # Обложка может использоваться другими книгами, неиспользуемые
+        # обложки и их файлы удаляет фоновая очистка
+        schedule_cover_gc()
 
         flash('Книга успешно удалена', 'success')
     except SQLAlchemyError as e:
@@ -0,0 +1,138 @@
+import os
+import click
+from concurrent.futures import ThreadPoolExecutor
+from flask.cli import with_appcontext
+from sqlalchemy import delete
+from models import db, Books, Covers, ImportProgress, Review
+from markup import render_markdown
+from covers import collect_covers, generate_derivatives, images_dir, migrate_legacy_covers, Image
+from cover_storage import cover_storage
+from search import rebuild_index
+from importer import BookImporter, read_records
+from exports import EXPORTS, FORMATS, export_chunks
+from replicas import read_replica
+
+
+def init_commands(app):
+    app.cli.add_command(render_markdown_command)
+    app.cli.add_command(regenerate_covers_command)
+    app.cli.add_command(migrate_covers_command)
+    app.cli.add_command(gc_covers_command)
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(import_books_command)
+    app.cli.add_command(export_command)
+
+
+# Заполнение HTML-версий описаний книг и текстов рецензий пачками по batch_size строк.
+# По умолчанию обрабатываются только строки без HTML, с --all пересчитываются все
+@click.command('render-markdown')
+@click.option('--batch-size', default=500, show_default=True)
+@click.option('--all', 'render_all', is_flag=True, help='Пересчитать HTML для всех строк')
+@with_appcontext
+def render_markdown_command(batch_size, render_all):
+    for model, key, source, target in (
+        (Books, Books.id_book, 'short_description', 'short_description_html'),
+        (Review, Review.id_review, 'text', 'text_html'),
+    ):
+        last_id = 0
+        total = 0
+        while True:
+            query = db.select(model).filter(key > last_id).order_by(key).limit(batch_size)
+            if not render_all:
+                query = query.filter(getattr(model, target).is_(None))
+            rows = db.session.execute(query).scalars().all()
+            if not rows:
+                break
+            for row in rows:
+                setattr(row, target, render_markdown(getattr(row, source)))
+            db.session.commit()
+            last_id = getattr(rows[-1], key.key)
+            total += len(rows)
+        click.echo(f'{model.__tablename__}: {total}')
+
+
+# Пересоздание производных (уменьшенных и WebP) для всех обложек хранилища
+@click.command('regenerate-covers')
+@click.option('--workers', default=4, show_default=True)
+@click.option('--force', is_flag=True, help='Перезаписать уже существующие производные')
+@with_appcontext
+def regenerate_covers_command(workers, force):
+    if Image is None:
+        raise click.ClickException('Для обработки обложек нужен пакет Pillow')
+    storage = cover_storage()
+    covers = db.session.execute(db.select(Covers.md5_hash, Covers.mimetype)).all()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda cover: generate_derivatives(storage, *cover, force=force), covers))
+    click.echo(f'covers: {sum(results)} of {len(covers)}')
+
+
+# Перенос файлов обложек из плоской раскладки <id_cover>.<ext> (по умолчанию static/images)
+# в хранилище с раскладкой ab/cd/<md5>.<ext>. Повторный запуск продолжает перенос
+@click.command('migrate-covers')
+@click.option('--source', type=click.Path(exists=True, file_okay=False), help='Каталог старой раскладки')
+@click.option('--copy', is_flag=True, help='Оставить исходные файлы на месте')
+@click.option('--batch-size', default=500, show_default=True)
+@with_appcontext
+def migrate_covers_command(source, copy, batch_size):
+    moved, missing = migrate_legacy_covers(cover_storage(), source or images_dir(), batch_size, copy)
+    click.echo(f'files moved: {moved}, covers without source file: {missing}')
+
+
+# Удаление обложек, на которые не ссылается ни одна книга, и файлов хранилища
+# без обложки в базе (старше --grace секунд). Можно запускать по расписанию
+@click.command('gc-covers')
+@click.option('--batch-size', default=500, show_default=True)
+@click.option('--grace', default=3600, show_default=True, help='Минимальный возраст удаляемых файлов, с')
+@with_appcontext
+def gc_covers_command(batch_size, grace):
+    covers, files = collect_covers(cover_storage(), batch_size, grace)
+    click.echo(f'covers removed: {covers}, orphaned files removed: {files}')
+
+
+# Перестроение полнотекстового индекса книг (в SQLite таблица индекса создается, если ее нет)
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    rebuild_index()
+    click.echo('search index rebuilt')
+
+
+# Массовый импорт книг из CSV или JSONL (формат определяется по расширению файла).
+# Пути обложек считаются относительно --covers-dir (по умолчанию - каталог файла).
+# Прогресс хранится в таблице import_progress под ключом --source (по умолчанию -
+# абсолютный путь файла), повторный запуск продолжает импорт с него; --restart
+# начинает импорт источника заново
+@click.command('import-books')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Формат файла')
+@click.option('--covers-dir', type=click.Path(exists=True, file_okay=False))
+@click.option('--batch-size', default=1000, show_default=True)
+@click.option('--workers', default=4, show_default=True)
+@click.option('--source', help='Ключ прогресса импорта (по умолчанию абсолютный путь файла)')
+@click.option('--restart', is_flag=True, help='Забыть сохраненный прогресс и начать сначала')
+@with_appcontext
+def import_books_command(path, fmt, covers_dir, batch_size, workers, source, restart):
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    source = source or os.path.abspath(path)
+    if restart:
+        db.session.execute(delete(ImportProgress).filter_by(source=source))
+        db.session.commit()
+    importer = BookImporter(covers_dir or os.path.dirname(os.path.abspath(path)), batch_size, workers, click.echo)
+    imported, skipped = importer.run(read_records(path, fmt), source)
+    click.echo(f'books imported: {imported}, skipped: {skipped}')
+    click.echo('facets and cached pages of running workers refresh by their TTL')
+
+
+# Выгрузка каталога или рецензий в файл (или в stdout), с --gzip - сжатая.
+# Читается с реплики, если они настроены
+@click.command('export')
+@click.argument('kind', type=click.Choice(list(EXPORTS)))
+@click.option('--format', 'fmt', type=click.Choice(list(FORMATS)), default='csv', show_default=True)
+@click.option('--gzip', 'compress', is_flag=True, help='Сжать выгрузку gzip')
+@click.option('-o', '--output', type=click.File('wb'), default='-', help='Файл выгрузки')
+@with_appcontext
+def export_command(kind, fmt, compress, output):
+    with read_replica():
+        for chunk in export_chunks(kind, fmt, compress):
+            output.write(chunk)
@@ -0,0 +1,187 @@
+import io
+import os
+import re
+import shutil
+import tempfile
+import time
+from threading import Lock
+from flask import current_app
+from werkzeug.utils import import_string
+
+# Хранилище файлов обложек. Файлы адресуются по содержимому: ключ оригинала -
+# ab/cd/<md5>.<ext>, производной - <size>/ab/cd/<md5>.<ext>, где ab и cd - первые
+# символы хеша. Так в одном каталоге не бывает больше нескольких сотен файлов, а
+# одинаковые обложки хранятся один раз. Реализация выбирается параметром COVER_STORAGE:
+# 'local' (по умолчанию, каталог COVER_STORAGE_ROOT, по умолчанию static/images),
+# 'memory' (в памяти процесса, для проверок и как образец объектного хранилища)
+# или путь 'модуль:Класс' к своей реализации CoverStorage.
+# Файлы старой плоской раскладки <id_cover>.<ext> переносит команда migrate-covers
+
+MD5_HASH = re.compile(r'^[0-9a-f]{32}$')
+# Каталог временных файлов загрузок внутри локального хранилища
+UPLOADS = '.uploads'
+CHUNK_SIZE = 64 * 1024
+
+
+def cover_key(md5_hash, ext, size=None):
+    key = f'{md5_hash[:2]}/{md5_hash[2:4]}/{md5_hash}.{ext}'
+    return f'{size}/{key}' if size else key
+
+
+# Разбор ключа в (size, md5_hash, ext); None, если ключ не в формате cover_key
+def parse_cover_key(key):
+    parts = key.split('/')
+    size = parts.pop(0) if len(parts) == 4 else None
+    if len(parts) != 3:
+        return None
+    md5_hash, _, ext = parts[2].partition('.')
+    if not MD5_HASH.match(md5_hash) or cover_key(md5_hash, ext, size) != key:
+        return None
+    return size, md5_hash, ext
+
+
+# Интерфейс хранилища. Ключи - относительные пути с разделителем '/'.
+# Запись атомарна: читатели видят либо старое содержимое, либо новое целиком
+class CoverStorage:
+    # Каталог временных файлов загрузок (None - системный)
+    upload_dir = None
+
+    @classmethod
+    def from_config(cls, app):
+        return cls()
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    # Файловый объект для чтения; FileNotFoundError, если ключа нет
+    def open(self, key):
+        raise NotImplementedError
+
+    def write(self, key, stream):
+        raise NotImplementedError
+
+    # Перенос локального файла в хранилище, исходный файл удаляется
+    def put_file(self, key, path):
+        with open(path, 'rb') as stream:
+            self.write(key, stream)
+        os.remove(path)
+
+    # Возвращает False, если ключа не было
+    def delete(self, key):
+        raise NotImplementedError
+
+    # Все ключи с временем изменения: пары (key, mtime)
+    def list(self):
+        raise NotImplementedError
+
+    # Путь в файловой системе для отдачи через send_file, если хранилище локальное
+    def local_path(self, key):
+        return None
+
+
+class LocalStorage(CoverStorage):
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.upload_dir = os.path.join(self.root, UPLOADS)
+
+    # Относительный COVER_STORAGE_ROOT считается от каталога приложения, а не от текущего
+    @classmethod
+    def from_config(cls, app):
+        root = app.config.get('COVER_STORAGE_ROOT') or os.path.join(app.static_folder, 'images')
+        return cls(os.path.join(app.root_path, root))
+
+    def path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def exists(self, key):
+        return os.path.isfile(self.path(key))
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def write(self, key, stream):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix='.tmp', delete=False)
+        try:
+            with tmp:
+                shutil.copyfileobj(stream, tmp, CHUNK_SIZE)
+            os.replace(tmp.name, path)
+        except BaseException:
+            os.remove(tmp.name)
+            raise
+
+    # Временные файлы загрузок лежат в том же разделе, поэтому перенос - это rename
+    def put_file(self, key, path):
+        target = self.path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.replace(path, target)
+        except OSError:
+            super().put_file(key, path)
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def list(self):
+        for directory, _, names in os.walk(self.root):
+            relative = os.path.relpath(directory, self.root)
+            prefix = '' if relative == '.' else relative.replace(os.sep, '/') + '/'
+            for name in names:
+                try:
+                    mtime = os.stat(os.path.join(directory, name)).st_mtime
+                except FileNotFoundError:
+                    continue
+                yield prefix + name, mtime
+
+    def local_path(self, key):
+        return self.path(key)
+
+
+class MemoryStorage(CoverStorage):
+    def __init__(self):
+        self._objects = {}
+        self._lock = Lock()
+
+    def exists(self, key):
+        return key in self._objects
+
+    def open(self, key):
+        try:
+            return io.BytesIO(self._objects[key][0])
+        except KeyError:
+            raise FileNotFoundError(key) from None
+
+    def write(self, key, stream):
+        data = stream.read()
+        with self._lock:
+            self._objects[key] = (data, time.time())
+
+    def delete(self, key):
+        with self._lock:
+            return self._objects.pop(key, None) is not None
+
+    def list(self):
+        with self._lock:
+            items = [(key, mtime) for key, (_, mtime) in self._objects.items()]
+        return iter(items)
+
+
+BACKENDS = {
+    'local': LocalStorage,
+    'memory': MemoryStorage,
+}
+
+
+def init_cover_storage(app):
+    backend = app.config.get('COVER_STORAGE', 'local')
+    cls = BACKENDS.get(backend) or import_string(backend)
+    app.extensions['cover_storage'] = cls.from_config(app)
+
+
+def cover_storage():
+    return current_app.extensions['cover_storage']
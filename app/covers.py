@@ -0,0 +1,394 @@
+import io
+import os
+import logging
+import mimetypes
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Timer
+from flask import Blueprint, current_app, url_for, send_file, abort
+from sqlalchemy import delete, select
+from models import db, Books, Covers
+from cover_storage import MD5_HASH, UPLOADS, cover_key, cover_storage, init_cover_storage, parse_cover_key
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Размеры производных обложек. thumb соответствует карточке каталога (.book-card img)
+COVER_SIZES = {
+    'thumb': (400, 550),
+}
+
+PIL_FORMATS = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG', 'gif': 'GIF', 'webp': 'WEBP'}
+
+_executor = None
+_executor_lock = Lock()
+
+# Наличие производных в хранилище (ключ -> время следующей проверки или None, если
+# файл есть), чтобы вывод карточек не обращался к хранилищу. Производные адресуются
+# хешем содержимого и не меняются, поэтому найденный файл запоминается до удаления
+# обложки; отсутствующий проверяется снова не раньше чем через COVER_VARIANT_RECHECK
+# секунд. Создание и удаление производных в этом процессе обновляют кэш сразу
+_variants = {}
+_variants_lock = Lock()
+VARIANT_CACHE_SIZE = 100000
+
+# Год - максимальный срок кэширования, который имеет смысл указывать в Cache-Control
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+bp = Blueprint('covers', __name__, url_prefix='/covers')
+
+
+def init_covers(app):
+    init_cover_storage(app)
+    app.add_template_global(cover_url)
+    app.add_template_global(cover_variant_url)
+
+
+# Каталог обложек старой плоской раскладки <id_cover>.<ext> (источник для migrate-covers)
+def images_dir():
+    return os.path.join(current_app.static_folder, 'images')
+
+
+# Пул фоновых потоков для обработки обложек, создается при первом обращении
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=current_app.config.get('COVER_WORKERS', 2),
+                thread_name_prefix='covers'
+            )
+        return _executor
+
+
+def _save_image(storage, image, key, fmt):
+    options = {'quality': 85, 'optimize': True} if fmt == 'JPEG' else {}
+    if fmt == 'WEBP':
+        options = {'quality': 80, 'method': 4}
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **options)
+    buffer.seek(0)
+    storage.write(key, buffer)
+
+
+# Создание уменьшенных копий обложки в исходном формате и в WebP.
+# Работает только с хранилищем, поэтому может выполняться вне контекста приложения
+def generate_derivatives(storage, md5_hash, mimetype, force=False):
+    if Image is None:
+        return False
+    source = cover_key(md5_hash, mimetype)
+    fmt = PIL_FORMATS.get(mimetype.lower())
+    if fmt is None or not storage.exists(source):
+        return False
+
+    with storage.open(source) as stream, Image.open(stream) as original:
+        original.load()
+        for size, dimensions in COVER_SIZES.items():
+            targets = [(mimetype, fmt), ('webp', 'WEBP')]
+            if not force:
+                targets = [(ext, f) for ext, f in targets if not storage.exists(cover_key(md5_hash, ext, size))]
+            if not targets:
+                continue
+            image = original.copy()
+            image.thumbnail(dimensions, Image.LANCZOS)
+            for ext, target_fmt in targets:
+                converted = image
+                if target_fmt == 'JPEG' and image.mode not in ('RGB', 'L'):
+                    converted = image.convert('RGB')
+                _save_image(storage, converted, cover_key(md5_hash, ext, size), target_fmt)
+                _remember_variant(cover_key(md5_hash, ext, size), None)
+    return True
+
+
+def _generate_logged(storage, md5_hash, mimetype, force=False):
+    try:
+        generate_derivatives(storage, md5_hash, mimetype, force)
+    except Exception:
+        logger.exception('Failed to generate derivatives for cover %s.%s', md5_hash, mimetype)
+
+
+# Постановка обложки в очередь фоновой обработки. Вызывается после commit
+# и сохранения исходного файла, запрос не ждет окончания обработки
+def schedule_derivatives(md5_hash, mimetype):
+    if Image is None:
+        return None
+    return get_executor().submit(_generate_logged, cover_storage(), md5_hash, mimetype)
+
+
+def cover_keys(md5_hash, mimetype):
+    keys = [cover_key(md5_hash, mimetype)]
+    for size in COVER_SIZES:
+        keys.extend(cover_key(md5_hash, ext, size) for ext in {mimetype, 'webp'})
+    return keys
+
+
+def remove_cover_files(storage, md5_hash, mimetype):
+    for key in cover_keys(md5_hash, mimetype):
+        storage.delete(key)
+        with _variants_lock:
+            _variants.pop(key, None)
+
+
+# Перенос файлов обложек из плоской раскладки <filename>.<ext> и <size>/<filename>.<ext>
+# каталога source в хранилище. С copy исходные файлы остаются на месте. Обложки, уже
+# перенесенные ранее, пропускаются, поэтому команду можно прерывать и запускать снова.
+# Возвращает число перенесенных файлов и число обложек без исходного файла
+def migrate_legacy_covers(storage, source, batch_size=500, copy=False):
+    moved = missing = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(Covers.id_cover, Covers.filename, Covers.mimetype, Covers.md5_hash)
+            .where(Covers.id_cover > last_id).order_by(Covers.id_cover).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        for row in rows:
+            files = [(row.filename, row.mimetype, None)]
+            files.extend((row.filename, ext, size) for size in COVER_SIZES for ext in {row.mimetype, 'webp'})
+            for filename, ext, size in files:
+                path = os.path.join(source, *filter(None, [size, f'{filename}.{ext}']))
+                key = cover_key(row.md5_hash, ext, size)
+                if not os.path.isfile(path):
+                    if size is None and not storage.exists(key):
+                        missing += 1
+                    continue
+                if storage.exists(key):
+                    if not copy:
+                        os.remove(path)
+                elif copy:
+                    with open(path, 'rb') as stream:
+                        storage.write(key, stream)
+                    moved += 1
+                else:
+                    storage.put_file(key, path)
+                    moved += 1
+        last_id = rows[-1].id_cover
+    return moved, missing
+
+
+# Сборка мусора обложек. Одна обложка может использоваться несколькими книгами
+# (save_cover_file и импорт переиспользуют обложку с тем же md5), поэтому удаление
+# книги обложку не трогает: после удаления планируется фоновая очистка
+# (schedule_cover_gc), которая через COVER_GC_DELAY секунд удаляет пачками по
+# COVER_GC_BATCH обложки, на которые не ссылается ни одна книга, а затем их файлы.
+# Несколько удалений за это время обрабатываются одной очисткой. Не чаще раза в
+# COVER_GC_ORPHAN_INTERVAL секунд очистка также удаляет из хранилища файлы, которым
+# не соответствует ни одна обложка (остатки прерванных загрузок и сбоев), если они
+# старше COVER_GC_GRACE секунд. То же вручную или по расписанию - команда gc-covers
+
+_gc_lock = Lock()
+_gc_state = {'pending': False, 'orphans_checked': 0}
+
+
+# Обложка, на которую не ссылается ни одна книга
+def _unused():
+    return ~select(Books.id_cover).where(Books.id_cover == Covers.id_cover).exists()
+
+
+# Обложки без книг. Строки блокируются до commit, поэтому загрузка, переиспользующая
+# обложку (поиск по md5 с блокировкой), либо дождется удаления и создаст новую
+# обложку, либо успеет сослаться на нее. Подзапрос по books при этом читается без
+# блокировки (MySQL не распространяет FOR UPDATE на подзапросы), поэтому DELETE
+# проверяет отсутствие книг еще раз (delete_unused_covers)
+def unused_covers_query(limit):
+    return (
+        select(Covers.id_cover, Covers.md5_hash, Covers.mimetype)
+        .where(_unused())
+        .order_by(Covers.id_cover)
+        .limit(limit)
+        .with_for_update()
+    )
+
+
+# Удаление файлов удаленных обложек. Повторная загрузка того же изображения после
+# commit создает новую обложку с тем же md5, а значит и с теми же ключами файлов,
+# поэтому файлы удаляются, только если обложки с таким md5 нет. Блокирующее чтение
+# по уникальному индексу md5 дожидается незафиксированной вставки такой обложки
+# и до commit не дает вставить новую (в MySQL - блокировкой промежутка индекса)
+def _remove_deleted_files(storage, rows):
+    if not rows:
+        return
+    alive = set(db.session.execute(
+        select(Covers.md5_hash).where(Covers.md5_hash.in_([row.md5_hash for row in rows])).with_for_update()
+    ).scalars())
+    try:
+        for row in rows:
+            if row.md5_hash not in alive:
+                remove_cover_files(storage, row.md5_hash, row.mimetype)
+    finally:
+        db.session.commit()
+
+
+# Удаление неиспользуемых обложек: строки удаляются и фиксируются пачкой,
+# файлы - после commit. DELETE в том же операторе проверяет, что на обложку
+# по-прежнему не ссылается ни одна книга: книга, успевшая сослаться на обложку
+# после выборки пачки, ее сохраняет (а внешний ключ books.id_cover с RESTRICT не
+# дает удалить обложку вместе с книгами). Возвращает число удаленных обложек
+def delete_unused_covers(storage, batch_size):
+    total = 0
+    while True:
+        rows = db.session.execute(unused_covers_query(batch_size)).all()
+        if not rows:
+            break
+        ids = [row.id_cover for row in rows]
+        db.session.execute(delete(Covers).where(Covers.id_cover.in_(ids), _unused()))
+        kept = set(db.session.execute(select(Covers.id_cover).where(Covers.id_cover.in_(ids))).scalars())
+        db.session.commit()
+        deleted = [row for row in rows if row.id_cover not in kept]
+        _remove_deleted_files(storage, deleted)
+        total += len(deleted)
+        if len(rows) < batch_size:
+            break
+    return total
+
+
+def _is_orphan(key, known):
+    parsed = parse_cover_key(key)
+    if parsed is None:
+        return True
+    size, md5_hash, ext = parsed
+    mimetype = known.get(md5_hash)
+    if size is None:
+        return ext != mimetype
+    return size not in COVER_SIZES or ext not in (mimetype, 'webp')
+
+
+# Ключи хранилища, которые не являются файлом или производной ни одной обложки,
+# с временем изменения раньше grace секунд назад. Рассматриваются только каталоги
+# раскладки ab/cd/ и временные загрузки: файлы старой плоской раскладки, еще не
+# перенесенные migrate-covers, не трогаются. Хранилище читается до запроса к базе:
+# файл обложки появляется только после commit ее строки
+def orphaned_keys(storage, grace):
+    deadline = time.time() - grace
+    candidates = [
+        key for key, mtime in storage.list()
+        if mtime < deadline and (key.count('/') >= 2 or key.startswith(f'{UPLOADS}/'))
+    ]
+    if not candidates:
+        return []
+    known = dict(db.session.execute(select(Covers.md5_hash, Covers.mimetype)).all())
+    return [key for key in candidates if _is_orphan(key, known)]
+
+
+def delete_orphaned_files(storage, grace):
+    return sum(storage.delete(key) for key in orphaned_keys(storage, grace))
+
+
+def collect_covers(storage, batch_size, grace, orphans=True):
+    covers = delete_unused_covers(storage, batch_size)
+    files = delete_orphaned_files(storage, grace) if orphans else 0
+    return covers, files
+
+
+def _collect_in_background(app):
+    with _gc_lock:
+        _gc_state['pending'] = False
+        orphans = time.time() - _gc_state['orphans_checked'] >= app.config.get('COVER_GC_ORPHAN_INTERVAL', 3600)
+        if orphans:
+            _gc_state['orphans_checked'] = time.time()
+    try:
+        with app.app_context():
+            covers, files = collect_covers(
+                cover_storage(), app.config.get('COVER_GC_BATCH', 500),
+                app.config.get('COVER_GC_GRACE', 3600), orphans
+            )
+        if covers or files:
+            logger.info('Cover GC removed %d covers and %d orphaned files', covers, files)
+    except Exception:
+        logger.exception('Cover GC failed')
+
+
+# Планирование фоновой очистки после удаления книги. Если очистка уже
+# запланирована и еще не началась, новая не создается
+def schedule_cover_gc():
+    with _gc_lock:
+        if _gc_state['pending']:
+            return None
+        _gc_state['pending'] = True
+    timer = Timer(current_app.config.get('COVER_GC_DELAY', 10), _collect_in_background,
+                  args=(current_app._get_current_object(),))
+    timer.daemon = True
+    timer.start()
+    return timer
+
+
+def _remember_variant(key, recheck_at):
+    with _variants_lock:
+        if len(_variants) >= VARIANT_CACHE_SIZE:
+            _variants.clear()
+        _variants[key] = recheck_at
+
+
+# Есть ли производная в хранилище, с учетом кэша _variants
+def variant_exists(key):
+    now = time.monotonic()
+    with _variants_lock:
+        recheck_at = _variants.get(key, 0)
+    if recheck_at is None:
+        return True
+    if recheck_at > now:
+        return False
+    exists = cover_storage().exists(key)
+    _remember_variant(key, None if exists else now + current_app.config.get('COVER_VARIANT_RECHECK', 10))
+    return exists
+
+
+# URL производной обложки или None, если она еще не создана.
+# cover - объект или строка запроса с полями mimetype и md5_hash
+def cover_variant_url(cover, size, ext=None):
+    ext = ext or cover.mimetype
+    if variant_exists(cover_key(cover.md5_hash, ext, size)):
+        return url_for('covers.serve_cover_variant', size=size, md5_hash=cover.md5_hash, ext=ext)
+    return None
+
+
+# URL обложки нужного размера; пока производная не готова, отдается оригинал.
+# В URL входит хеш содержимого, поэтому ответ можно кэшировать навсегда
+def cover_url(cover, size=None):
+    if size:
+        url = cover_variant_url(cover, size)
+        if url:
+            return url
+    return url_for('covers.serve_cover', md5_hash=cover.md5_hash, ext=cover.mimetype)
+
+
+# Отдача файла с неизменяемым кэшированием. send_file с conditional=True сам
+# обрабатывает If-None-Match/If-Modified-Since (304) и Range (206), а файл локального
+# хранилища передается через wsgi.file_wrapper (sendfile у gunicorn/uwsgi) или
+# X-Sendfile при USE_X_SENDFILE. Ключ строится по хешу из URL, поэтому база не нужна
+def _send_immutable(key, etag):
+    storage = cover_storage()
+    path = storage.local_path(key)
+    if path is not None:
+        if not os.path.isfile(path):
+            abort(404)
+        response = send_file(path, conditional=True, etag=etag, max_age=IMMUTABLE_MAX_AGE)
+    else:
+        try:
+            stream = storage.open(key)
+        except FileNotFoundError:
+            abort(404)
+        response = send_file(stream, mimetype=mimetypes.guess_type(key)[0], conditional=True,
+                             etag=etag, max_age=IMMUTABLE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@bp.route('/<md5_hash>.<ext>')
+def serve_cover(md5_hash, ext):
+    if not MD5_HASH.match(md5_hash) or ext not in PIL_FORMATS:
+        abort(404)
+    return _send_immutable(cover_key(md5_hash, ext), md5_hash)
+
+
+@bp.route('/<size>/<md5_hash>.<ext>')
+def serve_cover_variant(size, md5_hash, ext):
+    if not MD5_HASH.match(md5_hash) or size not in COVER_SIZES or ext not in PIL_FORMATS:
+        abort(404)
+    return _send_immutable(cover_key(md5_hash, ext, size), f'{md5_hash}-{size}-{ext}')
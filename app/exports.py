@@ -0,0 +1,125 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from flask import Blueprint, Response, abort, request, stream_with_context
+from flask_login import login_required
+from sqlalchemy import select
+from models import db, Books, BookStats, Review
+from books import admin_or_moderator
+
+bp = Blueprint('exports', __name__, url_prefix='/export')
+
+# Выгрузка каталога и рецензий в CSV или JSON Lines для аналитики.
+# Строки читаются пачками по BATCH_SIZE по ключу (WHERE id > :last ORDER BY id LIMIT n,
+# короткий запрос на пачку) и сразу отдаются клиенту блоками около CHUNK_SIZE байт,
+# поэтому расход памяти не зависит от размера таблиц. Курсор на стороне сервера
+# (stream_results) не подходит: драйвер mysql-connector его не поддерживает и читает
+# весь результат в память. Сжатие gzip выполняется на лету
+
+BATCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+def books_export_query():
+    return select(
+        Books.id_book,
+        Books.name_book,
+        Books.author,
+        Books.publisher,
+        Books.year,
+        Books.pages,
+        BookStats.genres,
+        BookStats.review_count,
+        BookStats.avg_rating,
+    ).join(BookStats, BookStats.id_book == Books.id_book)
+
+
+def reviews_export_query():
+    return select(
+        Review.id_review,
+        Review.id_book,
+        Review.id_user,
+        Review.rating,
+        Review.created_at,
+        Review.text,
+    )
+
+
+# Запрос выгрузки и ключ, по которому она читается пачками
+EXPORTS = {
+    'books': (books_export_query, Books.id_book),
+    'reviews': (reviews_export_query, Review.id_review),
+}
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+# Пачки строк выгрузки по возрастанию ключа
+def _batches(kind):
+    query, key = EXPORTS[kind]
+    last = None
+    while True:
+        batch = query().order_by(key).limit(BATCH_SIZE)
+        if last is not None:
+            batch = batch.where(key > last)
+        rows = db.session.execute(batch).all()
+        if rows:
+            yield rows
+        if len(rows) < BATCH_SIZE:
+            break
+        last = getattr(rows[-1], key.key)
+
+
+# Строки выгрузки в виде текстовых блоков
+def _text_chunks(kind, fmt):
+    columns = list(EXPORTS[kind][0]().selected_columns.keys())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(columns)
+    for rows in _batches(kind):
+        for row in rows:
+            if fmt == 'csv':
+                writer.writerow(row)
+            else:
+                buffer.write(json.dumps({key: _json_value(value) for key, value in zip(columns, row)}, ensure_ascii=False))
+                buffer.write('\n')
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    yield buffer.getvalue()
+
+
+# Выгрузка kind ('books' или 'reviews') в формате fmt ('csv' или 'jsonl') блоками байтов
+def export_chunks(kind, fmt, compress=False):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    for chunk in _text_chunks(kind, fmt):
+        data = chunk.encode('utf-8')
+        if compressor is not None:
+            data = compressor.compress(data)
+        if data:
+            yield data
+    if compressor is not None:
+        yield compressor.flush()
+
+
+# Скачивание выгрузки, например /export/books.csv или /export/reviews.jsonl?gzip=1
+@bp.route('/<kind>.<fmt>')
+@login_required
+@admin_or_moderator('admin')
+def export(kind, fmt):
+    if kind not in EXPORTS or fmt not in FORMATS:
+        abort(404)
+    compress = request.args.get('gzip', type=int, default=0) == 1
+    filename = f'{kind}.{fmt}' + ('.gz' if compress else '')
+    return Response(
+        stream_with_context(export_chunks(kind, fmt, compress)),
+        mimetype='application/gzip' if compress else FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename={filename}'},
+    )
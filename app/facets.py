@@ -0,0 +1,149 @@
+import bisect
+import time
+from threading import Lock
+from models import db, Books, ConnectGenreBook
+from pagination import KeysetPagination
+
+
+# Индекс жанр -> множество книг для фильтрации каталога по жанрам.
+# Множество хранится как битовая маска в целом числе Python (бит с номером id_book
+# установлен, если книга относится к жанру), поэтому пересечение и объединение
+# фильтров - это & и |, а количество книг - bit_count(), без JOIN с connect_genre_book.
+# Кроме масок индекс хранит ключи сортировки каталога (year, id_book) всех книг
+# по возрастанию: страница отфильтрованного каталога выбирается проходом по ним
+# с проверкой бита маски (GenrePagination), а из базы читаются только книги страницы.
+# Индекс строится при первом обращении в процессе, обновляется маршрутами книг
+# и целиком перестраивается не реже чем раз в ttl секунд, чтобы подхватить
+# изменения, сделанные другими воркерами
+class GenreIndex:
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.genres = {}
+        self.books = 0
+        self.order = []
+        self.years = {}
+        self.built_at = None
+        self._lock = Lock()
+
+    def build(self):
+        genres = {}
+        books = 0
+        years = {}
+        for id_book, year in db.session.query(Books.id_book, Books.year):
+            books |= 1 << id_book
+            years[id_book] = year
+        for id_genre, id_book in db.session.query(ConnectGenreBook.id_genre, ConnectGenreBook.id_book):
+            genres[id_genre] = genres.get(id_genre, 0) | (1 << id_book)
+        order = sorted((year, id_book) for id_book, year in years.items())
+        with self._lock:
+            self.genres = genres
+            self.books = books
+            self.order = order
+            self.years = years
+            self.built_at = time.monotonic()
+
+    def _remove_key(self, id_book):
+        year = self.years.pop(id_book, None)
+        if year is not None:
+            index = bisect.bisect_left(self.order, (year, id_book))
+            if index < len(self.order) and self.order[index] == (year, id_book):
+                del self.order[index]
+
+    def ensure_built(self):
+        if self.built_at is None or time.monotonic() - self.built_at > self.ttl:
+            self.build()
+
+    def set_book(self, id_book, year, genre_ids):
+        if self.built_at is None:
+            return
+        bit = 1 << id_book
+        with self._lock:
+            self.books |= bit
+            self._remove_key(id_book)
+            self.years[id_book] = year
+            bisect.insort(self.order, (year, id_book))
+            for id_genre in list(self.genres):
+                self.genres[id_genre] &= ~bit
+            for id_genre in genre_ids:
+                self.genres[id_genre] = self.genres.get(id_genre, 0) | bit
+
+    def remove_book(self, id_book):
+        if self.built_at is None:
+            return
+        mask = ~(1 << id_book)
+        with self._lock:
+            self.books &= mask
+            self._remove_key(id_book)
+            for id_genre in list(self.genres):
+                self.genres[id_genre] &= mask
+
+    # Маска книг, подходящих под фильтр: mode='and' - все выбранные жанры, 'or' - любой
+    def select(self, genre_ids, mode='and'):
+        self.ensure_built()
+        with self._lock:
+            sets = [self.genres.get(id_genre, 0) for id_genre in genre_ids]
+            if not sets:
+                return self.books
+            result = sets[0]
+            for bits in sets[1:]:
+                result = result & bits if mode == 'and' else result | bits
+            return result
+
+    # Количество книг по каждому жанру среди книг маски within
+    def counts(self, within=None):
+        self.ensure_built()
+        with self._lock:
+            if within is None:
+                within = self.books
+            return {id_genre: (bits & within).bit_count() for id_genre, bits in self.genres.items()}
+
+    # Ключи (year, id_book) книг маски bits строго после ключа cursor: по убыванию
+    # (forward) или по возрастанию; первые offset пропускаются. Маска переводится
+    # в байты, чтобы проверка бита не создавала на каждую книгу новое длинное число
+    def keys(self, bits, cursor, forward, offset, limit):
+        self.ensure_built()
+        data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+        size = len(data) * 8
+        keys = []
+        with self._lock:
+            order = self.order
+            if forward:
+                end = bisect.bisect_left(order, tuple(cursor)) if cursor else len(order)
+                positions = range(end - 1, -1, -1)
+            else:
+                start = bisect.bisect_right(order, tuple(cursor)) if cursor else 0
+                positions = range(start, len(order))
+            for position in positions:
+                key = order[position]
+                id_book = key[1]
+                if id_book < size and data[id_book >> 3] >> (id_book & 7) & 1:
+                    if offset:
+                        offset -= 1
+                        continue
+                    keys.append(key)
+                    if len(keys) == limit:
+                        break
+        return keys
+
+
+genre_index = GenreIndex()
+
+
+# Пагинация каталога, отфильтрованного по жанрам: ключи страницы берутся из
+# genre_index, а query (catalog_query) читает только эти книги по первичному ключу,
+# поэтому в базу не передается весь список подходящих книг
+class GenrePagination(KeysetPagination):
+    def __init__(self, query, bits, page, per_page, **kwargs):
+        self.bits = bits
+        super().__init__(query, [Books.year, Books.id_book], page, per_page, bits.bit_count(), **kwargs)
+
+    def _rows(self, cursor, forward, offset, limit):
+        ids = [id_book for _, id_book in genre_index.keys(self.bits, cursor, forward, offset, limit)]
+        if not ids:
+            return []
+        rows = {row.id_book: row for row in self.query.filter(Books.id_book.in_(ids))}
+        return [rows[id_book] for id_book in ids if id_book in rows]
+
+
+def init_facets(app):
+    genre_index.ttl = app.config.get('FACETS_TTL', 300)
@@ -0,0 +1,244 @@
+import csv
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from models import db, Books, Covers, ConnectGenreBook, BookStats, ImportProgress
+from markup import render_markdown
+from refdata import get_genres
+from search import index_new_books
+from stats import genres_label
+from covers import generate_derivatives
+from cover_storage import cover_key, cover_storage
+from books import detect_image_type, CHUNK_SIZE
+
+# Массовый импорт книг из CSV или JSON Lines.
+# Поля записи: name_book, author, year, publisher, pages, short_description,
+# genres (названия или id через ';' в CSV, список в JSONL), cover (путь к файлу обложки, обязателен).
+# Книги добавляются пачками: одна транзакция на пачку, книги, связи с жанрами,
+# статистика и обложки вставляются одним executemany. Обложки хешируются параллельно
+# и сверяются с covers.md5_hash, уже известные не копируются повторно.
+# Число обработанных записей источника хранится в import_progress и обновляется
+# в той же транзакции, что и пачка, поэтому прерванный импорт продолжается ровно
+# с первой незафиксированной пачки, без повторно добавленных книг
+
+REQUIRED_FIELDS = ('name_book', 'author', 'year', 'publisher', 'pages', 'cover')
+
+
+def read_records(path, fmt):
+    with open(path, encoding='utf-8', newline='') as file:
+        if fmt == 'csv':
+            for record in csv.DictReader(file):
+                record['genres'] = [genre for genre in (record.get('genres') or '').split(';') if genre.strip()]
+                yield record
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def hash_cover(path):
+    md5 = hashlib.md5()
+    image_type = None
+    with open(path, 'rb') as file:
+        while True:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if image_type is None:
+                image_type = detect_image_type(chunk)
+                if image_type is None:
+                    raise ValueError(f'{path}: файл не является изображением допустимого формата')
+            md5.update(chunk)
+    return md5.hexdigest(), image_type
+
+
+# Копирование файла обложки в хранилище (атомарная запись) и создание производных
+# (если установлен Pillow). Файл копируется до commit пачки: при ошибке остается
+# лишний файл (его удалит очистка обложек), но не строка covers без файла
+def copy_cover(storage, path, md5_hash, mimetype):
+    with open(path, 'rb') as stream:
+        storage.write(cover_key(md5_hash, mimetype), stream)
+    generate_derivatives(storage, md5_hash, mimetype)
+
+
+class BookImporter:
+    def __init__(self, covers_dir, batch_size=1000, workers=4, log=print):
+        self.covers_dir = covers_dir
+        self.batch_size = batch_size
+        self.workers = workers
+        self.log = log
+        self.genre_ids = {}
+        for genre in get_genres():
+            self.genre_ids[genre.name_genre.strip().lower()] = genre.id_genre
+            self.genre_ids[str(genre.id_genre)] = genre.id_genre
+        self.imported = 0
+        self.skipped = 0
+
+    # source - ключ прогресса в import_progress (None - без сохранения прогресса)
+    def run(self, records, source=None):
+        done = self._load_progress(source)
+        records = islice(records, done, None)
+        if done:
+            self.log(f'resuming after {done} records')
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                batch = list(islice(records, self.batch_size))
+                if not batch:
+                    break
+                self._import_with_retry(batch, executor, source, done + len(batch))
+                done += len(batch)
+                self.log(f'{done} records processed')
+        return self.imported, self.skipped
+
+    def _load_progress(self, source):
+        if not source:
+            return 0
+        return db.session.execute(select(ImportProgress.records).filter_by(source=source)).scalar() or 0
+
+    def _save_progress(self, source, done):
+        if not source:
+            return
+        result = db.session.execute(update(ImportProgress).filter_by(source=source).values(records=done))
+        if result.rowcount == 0:
+            db.session.execute(insert(ImportProgress).values(source=source, records=done))
+
+    # Пачка и прогресс фиксируются одним commit. Номер книги, выделенный пачке, может
+    # одновременно получить книга, добавленная через сайт; тогда пачка откатывается
+    # и импортируется заново с новыми номерами
+    def _import_with_retry(self, batch, executor, source, done, attempts=3):
+        covered = self._prepare_batch(batch, executor)
+        for attempt in range(attempts):
+            try:
+                imported = self._import_batch(covered, executor)
+                self._save_progress(source, done)
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                if attempt == attempts - 1:
+                    raise
+                self.log('batch conflicted with a concurrent insert, retrying')
+            else:
+                self.imported += imported
+                return
+
+    def _cover_path(self, record):
+        cover = record['cover'].strip()
+        return cover if os.path.isabs(cover) else os.path.join(self.covers_dir, cover)
+
+    def _valid(self, record):
+        missing = [field for field in REQUIRED_FIELDS if not str(record.get(field) or '').strip()]
+        if missing:
+            self.log(f'skipped "{record.get("name_book")}": missing {", ".join(missing)}')
+            return False
+        try:
+            int(record['year']), int(record['pages'])
+        except (TypeError, ValueError):
+            self.log(f'skipped "{record["name_book"]}": year and pages must be integers')
+            return False
+        return True
+
+    # Проверка записей пачки и хеширование обложек в несколько потоков. Обложка
+    # у книги обязательна, записи с нечитаемой обложкой пропускаются.
+    # Возвращает тройки (запись, путь к обложке, (md5, тип))
+    def _prepare_batch(self, batch, executor):
+        records = [record for record in batch if self._valid(record)]
+        self.skipped += len(batch) - len(records)
+        paths = [self._cover_path(record) for record in records]
+        hashes = list(executor.map(self._safe_hash, paths))
+        covered = [(record, path, cover) for record, path, cover in zip(records, paths, hashes) if cover]
+        self.skipped += len(records) - len(covered)
+        return covered
+
+    # Вставка книг пачки без commit. Возвращает число добавленных книг
+    def _import_batch(self, covered, executor):
+        if not covered:
+            return 0
+        cover_ids = self._store_covers([(path, cover) for _, path, cover in covered], executor)
+
+        books = []
+        book_genres = []
+        for id_book, (record, _, cover) in zip(self._allocate_ids(len(covered)), covered):
+            description = str(record.get('short_description') or '')
+            books.append({
+                'id_book': id_book,
+                'name_book': record['name_book'],
+                'author': record['author'],
+                'year': int(record['year']),
+                'publisher': record['publisher'],
+                'pages': int(record['pages']),
+                'short_description': description,
+                'short_description_html': render_markdown(description),
+                'id_cover': cover_ids[cover[0]],
+            })
+            book_genres.append(self._genre_ids(record.get('genres') or []))
+        db.session.execute(insert(Books), books)
+
+        links = [
+            {'id_book': book['id_book'], 'id_genre': id_genre}
+            for book, genre_ids in zip(books, book_genres) for id_genre in genre_ids
+        ]
+        if links:
+            db.session.execute(insert(ConnectGenreBook), links)
+        db.session.execute(insert(BookStats), [
+            {'id_book': book['id_book'], 'review_count': 0, 'rating_sum': 0, 'genres': genres_label(genre_ids)}
+            for book, genre_ids in zip(books, book_genres)
+        ])
+        index_new_books(books)
+        return len(books)
+
+    # Номера книг пачки выделяются подряд после наибольшего существующего и передаются
+    # в INSERT явно: MySQL (mysql-connector) не поддерживает RETURNING, и чтобы узнать
+    # сгенерированные ключи, SQLAlchemy вставлял бы книги по одной. Последняя строка
+    # books блокируется до commit, поэтому параллельный импорт ждет окончания пачки
+    def _allocate_ids(self, count):
+        last = db.session.execute(
+            select(Books.id_book).order_by(Books.id_book.desc()).limit(1).with_for_update()
+        ).scalar() or 0
+        return range(last + 1, last + 1 + count)
+
+    def _safe_hash(self, path):
+        try:
+            return hash_cover(path)
+        except (OSError, ValueError) as e:
+            self.log(f'skipped record with cover {path}: {e}')
+            return None
+
+    def _genre_ids(self, genres):
+        ids = []
+        for genre in genres:
+            id_genre = self.genre_ids.get(str(genre).strip().lower())
+            if id_genre is None:
+                self.log(f'unknown genre "{genre}"')
+            elif id_genre not in ids:
+                ids.append(id_genre)
+        return ids
+
+    # Добавление новых обложек пачки и копирование их файлов. Возвращает md5 -> id_cover
+    def _store_covers(self, covers, executor):
+        unique = {}
+        for path, (md5_hash, mimetype) in covers:
+            unique.setdefault(md5_hash, (path, mimetype))
+        if not unique:
+            return {}
+
+        existing = dict(db.session.execute(
+            select(Covers.md5_hash, Covers.id_cover).where(Covers.md5_hash.in_(unique)).with_for_update()
+        ).all())
+        new = {md5_hash: value for md5_hash, value in unique.items() if md5_hash not in existing}
+        if new:
+            db.session.execute(insert(Covers), [
+                {'md5_hash': md5_hash, 'mimetype': mimetype, 'filename': md5_hash}
+                for md5_hash, (_, mimetype) in new.items()
+            ])
+            created = dict(db.session.execute(
+                select(Covers.md5_hash, Covers.id_cover).where(Covers.md5_hash.in_(new))
+            ).all())
+            storage = cover_storage()
+            files = [(storage, path, md5_hash, mimetype) for md5_hash, (path, mimetype) in new.items()]
+            list(executor.map(lambda item: copy_cover(*item), files))
+            existing.update(created)
+        return existing
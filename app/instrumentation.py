@@ -0,0 +1,135 @@
+import hmac
+import logging
+import re
+import time
+from threading import Lock
+from flask import Blueprint, Response, abort, current_app, g, has_request_context, request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+bp = Blueprint('metrics', __name__)
+logger = logging.getLogger('catalog.sql')
+
+# Учет SQL-запросов по событиям движка SQLAlchemy: количество и время запросов
+# каждого HTTP-запроса (заголовок Server-Timing), журнал медленных запросов
+# (дольше SLOW_QUERY_MS) с нормализованным текстом и маршрутом, а также
+# накопленные по маршрутам счетчики в текстовом формате Prometheus (/metrics).
+# Счетчики хранятся в памяти процесса: при нескольких воркерах у каждого свои
+
+_settings = {'slow_query_ms': 200}
+
+
+def normalize_statement(statement):
+    statement = re.sub(r'\s+', ' ', statement).strip()
+    statement = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    statement = re.sub(r'\b\d+(?:\.\d+)?\b', '?', statement)
+    # Списки IN (?, ?, ...) разной длины сворачиваются, чтобы запрос узнавался одинаково
+    return re.sub(r'\(\s*(?:\?|%s|:\w+)(?:\s*,\s*(?:\?|%s|:\w+))+\s*\)', '(...)', statement)
+
+
+class EndpointMetrics:
+    FIELDS = ('requests', 'request_seconds', 'queries', 'query_seconds', 'slow_queries')
+
+    def __init__(self):
+        self._data = {}
+        self._lock = Lock()
+
+    def add(self, endpoint, **values):
+        with self._lock:
+            row = self._data.setdefault(endpoint, dict.fromkeys(self.FIELDS, 0))
+            for key, value in values.items():
+                row[key] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: dict(row) for endpoint, row in self._data.items()}
+
+    def render(self):
+        metrics = (
+            ('requests', 'catalog_http_requests_total', 'HTTP requests'),
+            ('request_seconds', 'catalog_http_request_seconds_total', 'Time spent handling HTTP requests'),
+            ('queries', 'catalog_sql_queries_total', 'SQL queries issued'),
+            ('query_seconds', 'catalog_sql_query_seconds_total', 'Time spent in SQL queries'),
+            ('slow_queries', 'catalog_sql_slow_queries_total', 'SQL queries slower than SLOW_QUERY_MS'),
+        )
+        data = self.snapshot()
+        lines = []
+        for field, name, description in metrics:
+            lines.append(f'# HELP {name} {description} by endpoint')
+            lines.append(f'# TYPE {name} counter')
+            for endpoint, row in sorted(data.items()):
+                value = row[field]
+                lines.append(f'{name}{{endpoint="{endpoint}"}} {round(value, 6) if isinstance(value, float) else value}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = EndpointMetrics()
+
+
+def _endpoint():
+    return request.endpoint or '<unmatched>'
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    slow = elapsed * 1000 >= _settings['slow_query_ms']
+    in_request = has_request_context()
+    if in_request:
+        g.sql_queries = g.get('sql_queries', 0) + 1
+        g.sql_seconds = g.get('sql_seconds', 0) + elapsed
+        g.sql_slow = g.get('sql_slow', 0) + slow
+    if slow:
+        logger.warning('slow query %.1f ms [%s] %s', elapsed * 1000,
+                       _endpoint() if in_request else '-', normalize_statement(statement))
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    if context.connection is not None:
+        started = context.connection.info.get('query_started')
+        if started:
+            started.pop()
+
+
+def init_instrumentation(app):
+    _settings['slow_query_ms'] = app.config.get('SLOW_QUERY_MS', 200)
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        if 'request_started' not in g:
+            return response
+        elapsed = time.perf_counter() - g.request_started
+        queries = g.get('sql_queries', 0)
+        query_seconds = g.get('sql_seconds', 0)
+        metrics.add(_endpoint(), requests=1, request_seconds=elapsed, queries=queries,
+                    query_seconds=query_seconds, slow_queries=g.get('sql_slow', 0))
+        if app.config.get('SERVER_TIMING', True):
+            response.headers.add('Server-Timing', f'db;dur={query_seconds * 1000:.1f};desc="{queries} queries"')
+            response.headers.add('Server-Timing', f'app;dur={elapsed * 1000:.1f}')
+        return response
+
+    app.register_blueprint(bp)
+
+
+# Счетчики для Prometheus. Если задан METRICS_TOKEN, доступ по заголовку
+# Authorization: Bearer <token>, иначе только администратору
+@bp.route('/metrics')
+def prometheus_metrics():
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            abort(401)
+    elif not (current_user.is_authenticated and current_user.is_admin()):
+        abort(403)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
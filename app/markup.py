@@ -0,0 +1,14 @@
+import bleach
+import markdown
+
+
+# Теги, которые может породить Markdown и которые разрешено выводить на страницах
+MARKDOWN_TAGS = bleach.sanitizer.ALLOWED_TAGS | {
+    'p', 'br', 'hr', 'pre', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+}
+
+
+# Markdown -> HTML с очисткой результата. Вызывается один раз при сохранении
+# книги или рецензии, страницы выводят уже готовый HTML
+def render_markdown(text):
+    return bleach.clean(markdown.markdown(text or ''), tags=MARKDOWN_TAGS, strip=True)
@@ -0,0 +1,33 @@
+"""Add cache_versions
+
+Revision ID: 2a9f6c8e1b47
+Revises: e4a7b90c3d18
+Create Date: 2026-10-18 14:35:51.604928
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2a9f6c8e1b47'
+down_revision = 'e4a7b90c3d18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    cache_versions_table = op.create_table('cache_versions',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.Integer(), server_default='1', nullable=False),
+    sa.PrimaryKeyConstraint('name', name=op.f('pk_cache_versions'))
+    )
+    op.bulk_insert(cache_versions_table,
+        [
+            {'name': 'genres', 'version': 1},
+            {'name': 'users', 'version': 1},
+        ])
+
+
+def downgrade():
+    op.drop_table('cache_versions')
@@ -0,0 +1,66 @@
+"""Add book_stats
+
+Revision ID: 5b2c7d41e9a3
+Revises: 3f0e08e708e2
+Create Date: 2026-10-18 10:12:04.318227
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b2c7d41e9a3'
+down_revision = '3f0e08e708e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('book_stats',
+    sa.Column('id_book', sa.Integer(), nullable=False),
+    sa.Column('review_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('avg_rating', sa.Float(), nullable=True),
+    sa.Column('genres', sa.String(length=1024), server_default='', nullable=False),
+    sa.ForeignKeyConstraint(['id_book'], ['books.id_book'], name=op.f('fk_book_stats_id_book_books'), ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id_book', name=op.f('pk_book_stats'))
+    )
+    data_upgrades()
+
+
+def downgrade():
+    op.drop_table('book_stats')
+
+
+# Заполнение статистики для уже существующих книг. Строка жанров собирается
+# в Python так же, как genres_label() в stats.py: GROUP_CONCAT(... ORDER BY ...)
+# не поддерживается SQLite до версии 3.44
+def data_upgrades():
+    op.execute(sa.text("""
+        INSERT INTO book_stats (id_book, review_count, rating_sum, avg_rating, genres)
+        SELECT b.id_book,
+               COUNT(r.id_review),
+               COALESCE(SUM(r.rating), 0),
+               ROUND(AVG(r.rating), 1),
+               ''
+        FROM books b
+        LEFT JOIN reviews r ON r.id_book = b.id_book
+        GROUP BY b.id_book
+    """))
+
+    connection = op.get_bind()
+    labels = {}
+    rows = connection.execute(sa.text("""
+        SELECT c.id_book, g.name_genre
+        FROM connect_genre_book c
+        JOIN genres g ON g.id_genre = c.id_genre
+        ORDER BY c.id_book, g.id_genre
+    """))
+    for id_book, name_genre in rows:
+        labels.setdefault(id_book, []).append(name_genre)
+    if labels:
+        connection.execute(
+            sa.text("UPDATE book_stats SET genres = :genres WHERE id_book = :id_book"),
+            [{'id_book': id_book, 'genres': ','.join(names)} for id_book, names in labels.items()]
+        )
@@ -0,0 +1,43 @@
+"""Add updated_at to books and book_stats
+
+Revision ID: 7c3d5e9f1a62
+Revises: 2a9f6c8e1b47
+Create Date: 2026-10-18 15:48:26.730415
+
+"""
+from datetime import datetime, timezone
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3d5e9f1a62'
+down_revision = '2a9f6c8e1b47'
+branch_labels = None
+depends_on = None
+
+UpdatedAt = sa.DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql')
+
+
+def upgrade():
+    for table in ('books', 'book_stats'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', UpdatedAt, nullable=True))
+    data_upgrades()
+    for table in ('books', 'book_stats'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column('updated_at', existing_type=UpdatedAt, nullable=False)
+
+
+def downgrade():
+    for table in ('book_stats', 'books'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('updated_at')
+
+
+# Существующие строки считаются измененными в момент миграции
+def data_upgrades():
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    for table in ('books', 'book_stats'):
+        op.execute(sa.text(f'UPDATE {table} SET updated_at = :now').bindparams(now=now))
@@ -0,0 +1,26 @@
+"""Add books (year, id_book) index
+
+Revision ID: 9d4e1a6c2f75
+Revises: 5b2c7d41e9a3
+Create Date: 2026-10-18 11:03:47.902145
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4e1a6c2f75'
+down_revision = '5b2c7d41e9a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.create_index('ix_books_year_id_book', ['year', 'id_book'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.drop_index('ix_books_year_id_book')
@@ -0,0 +1,36 @@
+"""Add reviews (id_book, created_at, id_review) index
+
+Revision ID: b6e2d9f4a813
+Revises: 7c3d5e9f1a62
+Create Date: 2026-10-18 16:42:09.318274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e2d9f4a813'
+down_revision = '7c3d5e9f1a62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.create_index('ix_reviews_id_book_created_at', ['id_book', 'created_at', 'id_review'], unique=False)
+
+
+def downgrade():
+    # MySQL может удалить автоматически созданный индекс внешнего ключа
+    # fk_reviews_id_book_books, если его заменяет составной индекс; без индекса
+    # по id_book составной удалить нельзя
+    bind = op.get_bind()
+    if bind.dialect.name == 'mysql':
+        indexes = sa.inspect(bind).get_indexes('reviews')
+        if not any(index['column_names'][:1] == ['id_book'] and index['name'] != 'ix_reviews_id_book_created_at'
+                   for index in indexes):
+            op.create_index('fk_reviews_id_book_books', 'reviews', ['id_book'], unique=False)
+
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.drop_index('ix_reviews_id_book_created_at')
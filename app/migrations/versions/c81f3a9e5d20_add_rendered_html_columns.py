@@ -0,0 +1,34 @@
+"""Add rendered HTML columns
+
+Revision ID: c81f3a9e5d20
+Revises: 9d4e1a6c2f75
+Create Date: 2026-10-18 12:26:10.551873
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81f3a9e5d20'
+down_revision = '9d4e1a6c2f75'
+branch_labels = None
+depends_on = None
+
+
+# После применения миграции HTML для существующих строк заполняется командой
+# flask render-markdown
+def upgrade():
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('short_description_html', sa.Text(), nullable=True))
+
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('text_html', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('reviews', schema=None) as batch_op:
+        batch_op.drop_column('text_html')
+
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.drop_column('short_description_html')
@@ -0,0 +1,30 @@
+"""Add import_progress
+
+Revision ID: d3f8a1c6b592
+Revises: b6e2d9f4a813
+Create Date: 2026-10-18 19:08:37.215649
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3f8a1c6b592'
+down_revision = 'b6e2d9f4a813'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('import_progress',
+    sa.Column('source', sa.String(length=255), nullable=False),
+    sa.Column('records', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('updated_at', sa.DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql'), nullable=False),
+    sa.PrimaryKeyConstraint('source', name=op.f('pk_import_progress'))
+    )
+
+
+def downgrade():
+    op.drop_table('import_progress')
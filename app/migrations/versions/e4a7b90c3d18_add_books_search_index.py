@@ -0,0 +1,34 @@
+"""Add books full-text search index
+
+Revision ID: e4a7b90c3d18
+Revises: c81f3a9e5d20
+Create Date: 2026-10-18 13:48:22.170364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a7b90c3d18'
+down_revision = 'c81f3a9e5d20'
+branch_labels = None
+depends_on = None
+
+
+# В MySQL - FULLTEXT-индекс на самой таблице books, в SQLite - виртуальная таблица FTS5
+def upgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE books_fts USING fts5(name_book, author, publisher, short_description, tokenize='unicode61')")
+        op.execute('INSERT INTO books_fts (rowid, name_book, author, publisher, short_description) '
+                   'SELECT id_book, name_book, author, publisher, short_description FROM books')
+    else:
+        op.create_index('ft_books_search', 'books', ['name_book', 'author', 'publisher', 'short_description'],
+                        unique=False, mysql_prefix='FULLTEXT')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('DROP TABLE books_fts')
+    else:
+        op.drop_index('ft_books_search', table_name='books')
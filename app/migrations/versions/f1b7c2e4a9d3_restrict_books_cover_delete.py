@@ -0,0 +1,27 @@
+"""Restrict deleting covers used by books
+
+Revision ID: f1b7c2e4a9d3
+Revises: d3f8a1c6b592
+Create Date: 2026-10-18 21:42:10.518304
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b7c2e4a9d3'
+down_revision = 'd3f8a1c6b592'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.drop_constraint(batch_op.f('fk_books_id_cover_covers'), type_='foreignkey')
+        batch_op.create_foreign_key(batch_op.f('fk_books_id_cover_covers'), 'covers', ['id_cover'], ['id_cover'], ondelete='RESTRICT')
+
+
+def downgrade():
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.drop_constraint(batch_op.f('fk_books_id_cover_covers'), type_='foreignkey')
+        batch_op.create_foreign_key(batch_op.f('fk_books_id_cover_covers'), 'covers', ['id_cover'], ['id_cover'], ondelete='CASCADE')
@@ -1,13 +1,28 @@
 from typing import Optional
 import sqlalchemy as sa
-from werkzeug.security import check_password_hash, generate_password_hash
+from passwords import hash_password, verify_password
+from replicas import RoutingSession
 from flask_login import UserMixin, current_user
 from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import String, ForeignKey, MetaData, Date, Integer, DateTime, Text
-from datetime import datetime
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import String, ForeignKey, MetaData, Date, Integer, DateTime, Text, Float, Index
+from sqlalchemy.dialects import mysql, sqlite
+from datetime import datetime, timezone
+
+# Время изменения строки (UTC, с микросекундами, в MySQL - DATETIME(6)). Выставляется
+# приложением при INSERT и UPDATE, в том числе в UPDATE без ORM (см. stats.py);
+# по нему API отдает ETag и Last-Modified
+def utcnow():
+   return datetime.now(timezone.utc).replace(tzinfo=None)
+
+UpdatedAt = DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql')
+
+# Время создания рецензии заполняет СУБД с точностью до секунды. SQLite хранит дату
+# строкой и сравнивает строки, поэтому параметры (курсор рецензий) передаются в том же
+# формате, без долей секунды, иначе равные значения не совпадут
+CreatedAt = DateTime().with_variant(sqlite.DATETIME(truncate_microseconds=True), 'sqlite')
 
 class Base(DeclarativeBase):
   metadata = MetaData(naming_convention={
@@ -18,14 +33,22 @@ class Base(DeclarativeBase):
         "pk": "pk_%(table_name)s"
     })
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
 
 class Genres(Base):
    __tablename__ = 'genres'
    id_genre: Mapped[int] = mapped_column(primary_key=True)
    name_genre: Mapped[str] = mapped_column(String(128))
 
-class Users(Base,  UserMixin):
+# Проверки роли пользователя, общие для модели Users и снимка пользователя из кэша сессий (auth.py)
+class RoleMixin:
+   def is_admin(self):
+        return self.id_role == current_app.config['ADMIN_ROLE_ID']
+   
+   def is_moderator(self):
+        return self.id_role == current_app.config['MODERATOR_ROLE_ID']
+
+class Users(Base, UserMixin, RoleMixin):
    __tablename__ = 'users'
    id_user: Mapped[int] = mapped_column(primary_key=True)
    name: Mapped[str] = mapped_column(String(128))
@@ -36,17 +59,11 @@ class Users(Base,  UserMixin):
    id_role: Mapped[int] = mapped_column(ForeignKey('roles.id_role', ondelete='CASCADE'))
 
    def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
-        return self.password_hash
+        self.hash_pass = hash_password(password)
+        return self.hash_pass
    
    def check_password(self, password):
-      return check_password_hash(self.hash_pass, password)
-
-   def is_admin(self):
-        return self.id_role == current_app.config['ADMIN_ROLE_ID']
-   
-   def is_moderator(self):
-        return self.id_role == current_app.config['MODERATOR_ROLE_ID']
+      return verify_password(self.hash_pass, password)
 
    def get_id(self):
       return str(self.id_user) 
@@ -56,20 +73,44 @@ class Review(Base):
     id_review: Mapped[int] = mapped_column(primary_key=True)
     rating: Mapped[int] = mapped_column(Integer, nullable=False)
     text: Mapped[str] = mapped_column(Text, nullable=False)
-    created_at: Mapped[datetime] = mapped_column(server_default=sa.sql.func.now())
+    text_html: Mapped[Optional[str]] = mapped_column(Text)
+    created_at: Mapped[datetime] = mapped_column(CreatedAt, server_default=sa.sql.func.now())
     id_book: Mapped[int] = mapped_column(ForeignKey('books.id_book', ondelete='CASCADE'), nullable=False)
     id_user: Mapped[int] = mapped_column(ForeignKey('users.id_user', ondelete='CASCADE'), nullable=False)
 
+    user: Mapped['Users'] = relationship(viewonly=True)
+
+    # Индекс для постраничного вывода рецензий книги по ключу (created_at, id_review):
+    # каждая страница - просмотр диапазона индекса
+    __table_args__ = (
+        Index('ix_reviews_id_book_created_at', 'id_book', 'created_at', 'id_review'),
+    )
+
 class Books(Base):
    __tablename__ = 'books'
    id_book: Mapped[int] = mapped_column(primary_key=True)
    name_book: Mapped[str] = mapped_column(String(128))
    short_description: Mapped[str] = mapped_column(Text())
+   short_description_html: Mapped[Optional[str]] = mapped_column(Text())
    year: Mapped[int] = mapped_column(Integer())
    publisher: Mapped[str] = mapped_column(String(128))
    author: Mapped[str] = mapped_column(String(128))
    pages: Mapped[int] = mapped_column(Integer())
-   id_cover: Mapped[int] = mapped_column(ForeignKey('covers.id_cover', ondelete='CASCADE'))
+   # RESTRICT: обложка удаляется только сборкой мусора (covers.py) и только без книг
+   id_cover: Mapped[int] = mapped_column(ForeignKey('covers.id_cover', ondelete='RESTRICT'))
+   updated_at: Mapped[datetime] = mapped_column(UpdatedAt, default=utcnow, onupdate=utcnow)
+
+   # Связи только для чтения: изменение жанров и удаление книги по-прежнему
+   # выполняются явно через ConnectGenreBook и ON DELETE CASCADE
+   cover: Mapped[Optional['Covers']] = relationship(viewonly=True)
+   genres: Mapped[list['Genres']] = relationship(secondary='connect_genre_book', order_by='Genres.id_genre', viewonly=True)
+
+   # Индекс для пагинации каталога по ключу (year, id_book) и полнотекстовый индекс
+   # для поиска (только MySQL, в SQLite поиск идет по таблице FTS5, см. search.py)
+   __table_args__ = (
+      Index('ix_books_year_id_book', 'year', 'id_book'),
+      Index('ft_books_search', 'name_book', 'author', 'publisher', 'short_description', mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+   )
 
 class Covers(Base):
    __tablename__ = 'covers'
@@ -88,3 +129,29 @@ class ConnectGenreBook(Base):
    __tablename__ = 'connect_genre_book'
    id_book: Mapped[int] = mapped_column(ForeignKey('books.id_book', ondelete='CASCADE'), primary_key=True)
    id_genre: Mapped[int] = mapped_column(ForeignKey('genres.id_genre', ondelete='CASCADE'), primary_key=True)
+
+# Денормализованная статистика по книге: количество рецензий, сумма и средняя оценка,
+# строка с жанрами. Обновляется в тех же транзакциях, что и книги/рецензии (см. stats.py),
+# поэтому главной странице не нужно агрегировать таблицу рецензий
+class BookStats(Base):
+   __tablename__ = 'book_stats'
+   id_book: Mapped[int] = mapped_column(ForeignKey('books.id_book', ondelete='CASCADE'), primary_key=True)
+   review_count: Mapped[int] = mapped_column(Integer(), default=0, server_default='0')
+   rating_sum: Mapped[int] = mapped_column(Integer(), default=0, server_default='0')
+   avg_rating: Mapped[Optional[float]] = mapped_column(Float())
+   genres: Mapped[str] = mapped_column(String(1024), default='', server_default='')
+   updated_at: Mapped[datetime] = mapped_column(UpdatedAt, default=utcnow, onupdate=utcnow)
+
+# Версии справочных таблиц и кэшей, хранимых в памяти процессов (жанры - refdata.py, пользователи - auth.py)
+class CacheVersions(Base):
+   __tablename__ = 'cache_versions'
+   name: Mapped[str] = mapped_column(String(64), primary_key=True)
+   version: Mapped[int] = mapped_column(Integer(), default=1, server_default='1')
+
+# Ход массового импорта книг (importer.py): число обработанных записей источника.
+# Обновляется в транзакции пачки вместе с самими книгами
+class ImportProgress(Base):
+   __tablename__ = 'import_progress'
+   source: Mapped[str] = mapped_column(String(255), primary_key=True)
+   records: Mapped[int] = mapped_column(Integer(), default=0, server_default='0')
+   updated_at: Mapped[datetime] = mapped_column(UpdatedAt, default=utcnow, onupdate=utcnow)
@@ -0,0 +1,141 @@
+import time
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+from flask import request, session, g, make_response, current_app
+from flask_login import current_user
+
+
+# LRU-кэш отрендеренных страниц. Каждая запись помечается тегами
+# ('catalog', 'book:<id>'), по которым изменяющие маршруты точечно сбрасывают кэш.
+# Кэш живет в памяти процесса, поэтому записи дополнительно ограничены ttl:
+# изменения, сделанные в другом воркере, станут видны не позже чем через ttl секунд
+class PageCache:
+    def __init__(self, max_size=512, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, body, mimetype, tags):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (body, mimetype, time.monotonic() + self.ttl, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                for key in self._tags.pop(tag, set()):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[3]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+cache = PageCache()
+
+
+def init_page_cache(app):
+    cache.max_size = app.config.get('PAGE_CACHE_SIZE', 512)
+    cache.ttl = app.config.get('PAGE_CACHE_TTL', 60)
+    cache.enabled = app.config.get('PAGE_CACHE_ENABLED', True)
+
+
+# Класс зрителя, от которого зависит разметка страниц (index.html показывает
+# кнопки редактирования и удаления в зависимости от роли)
+def viewer_class():
+    if not current_user.is_authenticated:
+        return 'anonymous'
+    if current_user.is_admin():
+        return 'admin'
+    if current_user.is_moderator():
+        return 'moderator'
+    return 'user'
+
+
+# Дополнительные теги для текущей страницы, например id книг, попавших в каталог
+def tag_page(*tags):
+    g.setdefault('page_cache_tags', []).extend(tags)
+
+
+def invalidate(*tags):
+    cache.invalidate(*tags)
+
+
+# Декоратор кэширования страницы. tags - функция от аргументов маршрута,
+# возвращающая теги страницы; per_user - страница содержит данные конкретного
+# пользователя (например, его рецензию), поэтому ключ включает id пользователя.
+# Не кэшируются ответы с flash-сообщениями и ответы с кодом, отличным от 200
+def cached_page(tags, per_user=False):
+    def decorator(func):
+        @wraps(func)
+        def decorated(*args, **kwargs):
+            if not cache.enabled or request.method != 'GET' or session.get('_flashes'):
+                return current_app.ensure_sync(func)(*args, **kwargs)
+
+            viewer = viewer_class()
+            if per_user and current_user.is_authenticated:
+                viewer = f'{viewer}:{current_user.get_id()}'
+            key = (request.endpoint, tuple(sorted(kwargs.items())), tuple(sorted(request.args.items(multi=True))), viewer)
+
+            entry = cache.get(key)
+            if entry is not None:
+                response = make_response(entry[0])
+                response.mimetype = entry[1]
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            response = make_response(current_app.ensure_sync(func)(*args, **kwargs))
+            if response.status_code == 200 and not session.get('_flashes'):
+                page_tags = list(tags(**kwargs)) + g.pop('page_cache_tags', [])
+                cache.set(key, response.get_data(), response.mimetype, page_tags)
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return decorated
+    return decorator
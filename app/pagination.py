@@ -0,0 +1,207 @@
+import time
+from threading import Lock
+from sqlalchemy import and_, or_
+
+
+# Сколько ссылок на соседние страницы показывать слева и справа от текущей
+WINDOW = 2
+
+_count_cache = {}
+_count_lock = Lock()
+
+
+# Общее количество строк хранится в памяти процесса не дольше ttl секунд,
+# чтобы не выполнять COUNT(*) на каждый запрос страницы каталога
+def cached_count(name, query, ttl):
+    now = time.monotonic()
+    with _count_lock:
+        cached = _count_cache.get(name)
+        if cached and cached[1] > now:
+            return cached[0]
+    total = query.count()
+    with _count_lock:
+        _count_cache[name] = (total, now + ttl)
+    return total
+
+
+def invalidate_count(name):
+    with _count_lock:
+        _count_cache.pop(name, None)
+
+
+def encode_cursor(values):
+    return '_'.join(str(value) for value in values)
+
+
+def decode_cursor(cursor, size):
+    if not cursor:
+        return None
+    try:
+        values = [int(value) for value in cursor.split('_')]
+    except ValueError:
+        return None
+    return values if len(values) == size else None
+
+
+# Условие "строка идет после курсора" для сортировки по убыванию всех колонок:
+# a <= x AND ((a < x) OR (a = x AND b < y) ...). Для обратного направления знаки
+# меняются. Условие a <= x избыточно, но без него планировщик (SQLite с параметрами
+# запроса, MySQL) не видит диапазона по индексу и читает его от начала
+def _seek_condition(columns, values, forward):
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [c == v for c, v in zip(columns[:i], values[:i])]
+        compare = column < values[i] if forward else column > values[i]
+        clauses.append(and_(*equal, compare))
+    bound = columns[0] <= values[0] if forward else columns[0] >= values[0]
+    return and_(bound, or_(*clauses))
+
+
+# Пагинация по ключу (seek/keyset). Строки сортируются по убыванию columns,
+# следующая страница выбирается условием "после последней строки текущей",
+# а не через OFFSET, поэтому стоимость не зависит от номера страницы.
+# Номер страницы передается только для отображения; ссылки на соседние
+# страницы внутри окна используют курсор и небольшой skip (не больше WINDOW страниц).
+# Ссылки вида ?page=N без курсора (старые ссылки, обход роботами) выбираются через
+# OFFSET только в пределах WINDOW страниц от начала или от конца выборки, остальные
+# номера приводятся к последней странице начального окна
+class KeysetPagination:
+    def __init__(self, query, columns, page, per_page, total, after=None, before=None, skip=0, last=False):
+        self.query = query
+        self.columns = columns
+        self.per_page = per_page
+        self.total = total
+        self.pages = max(1, (total + per_page - 1) // per_page)
+        self.page = max(1, page)
+        skip = min(max(skip, 0), (WINDOW - 1) * per_page)
+        # Аргументы ссылки на текущую страницу (курсор, по которому она выбрана)
+        self.current_args = {'skip': skip} if skip else {}
+        before_key = decode_cursor(before, len(columns))
+        after_key = decode_cursor(after, len(columns))
+
+        if before_key:
+            self.current_args['before'] = before
+            rows = self._rows(before_key, False, skip, per_page + 1)
+            self.has_prev = len(rows) > per_page
+            self.items = rows[:per_page][::-1]
+            self.has_next = True
+            if not self.has_prev:
+                self.page = 1
+                self.current_args = {}
+        elif after_key:
+            self.current_args['after'] = after
+            rows = self._rows(after_key, True, skip, per_page + 1)
+            self.has_next = len(rows) > per_page
+            self.items = rows[:per_page]
+            self.has_prev = self.page > 1
+        elif last or WINDOW + 1 < self.page and self.pages - self.page <= WINDOW:
+            # Страницы в конце выборки читаются в обратном порядке с небольшим OFFSET
+            self.page = min(self.page, self.pages) if not last else self.pages
+            self.current_args = {'last': 1} if self.page == self.pages else {}
+            count = min(per_page, total - (self.page - 1) * per_page)
+            rows = self._rows(None, False, total - (self.page - 1) * per_page - count, count or per_page)
+            self.items = rows[::-1]
+            self.has_prev = self.page > 1
+            self.has_next = self.page < self.pages
+        else:
+            self.page = min(self.page, WINDOW + 1)
+            self.current_args = {}
+            rows = self._rows(None, True, (self.page - 1) * per_page, per_page + 1)
+            self.has_next = len(rows) > per_page
+            self.items = rows[:per_page]
+            self.has_prev = self.page > 1
+
+    # Строки после курсора (forward, по убыванию columns) или до него (по возрастанию).
+    # Без курсора - от начала или от конца выборки
+    def _rows(self, cursor, forward, offset, limit):
+        query = self.query
+        if cursor:
+            query = query.filter(_seek_condition(self.columns, cursor, forward))
+        order = [column.desc() if forward else column.asc() for column in self.columns]
+        return query.order_by(*order).offset(offset).limit(limit).all()
+
+    def _key(self, row):
+        return encode_cursor(getattr(row, column.key) for column in self.columns)
+
+    # Аргументы url_for для перехода на страницу number, None если перейти нельзя
+    def page_args(self, number):
+        if number == 1:
+            return {}
+        if number == self.page:
+            return dict(self.current_args, page=number)
+        if number == self.pages and number - self.page > WINDOW:
+            return {'page': number, 'last': 1}
+        if not self.items:
+            return None
+        if number > self.page:
+            args = {'page': number, 'after': self._key(self.items[-1])}
+            skip = (number - self.page - 1) * self.per_page
+        else:
+            args = {'page': number, 'before': self._key(self.items[0])}
+            skip = (self.page - number - 1) * self.per_page
+        if skip:
+            args['skip'] = skip
+        return args
+
+    @property
+    def prev_args(self):
+        return self.page_args(self.page - 1) if self.has_prev else None
+
+    @property
+    def next_args(self):
+        return self.page_args(self.page + 1) if self.has_next else None
+
+    # Окно ссылок вокруг текущей страницы плюс первая и последняя страницы.
+    # None в списке обозначает пропуск (многоточие)
+    def iter_pages(self):
+        start = max(1, self.page - WINDOW)
+        end = min(self.pages, self.page + WINDOW)
+        if not self.has_next:
+            end = self.page
+        if start > 1:
+            yield 1, {}
+            if start > 2:
+                yield None, None
+        for number in range(start, end + 1):
+            args = self.page_args(number)
+            if args is not None:
+                yield number, args
+        if self.has_next and end < self.pages:
+            if end < self.pages - 1:
+                yield None, None
+            yield self.pages, self.page_args(self.pages)
+
+
+# Пагинация через OFFSET для выборок, упорядоченных не по ключу (например, по
+# релевантности поиска). Общее количество не считается: запрашивается на одну
+# строку больше, чтобы узнать, есть ли следующая страница. Интерфейс для шаблона
+# pagination.html тот же, что у KeysetPagination
+class OffsetPagination:
+    def __init__(self, query, page, per_page, max_page=100):
+        self.per_page = per_page
+        self.page = min(max(1, page), max_page)
+        rows = query.offset((self.page - 1) * per_page).limit(per_page + 1).all()
+        self.has_next = len(rows) > per_page and self.page < max_page
+        self.has_prev = self.page > 1
+        self.items = rows[:per_page]
+        self.pages = self.page + 1 if self.has_next else self.page
+
+    def page_args(self, number):
+        return {'page': number} if number > 1 else {}
+
+    @property
+    def prev_args(self):
+        return self.page_args(self.page - 1) if self.has_prev else None
+
+    @property
+    def next_args(self):
+        return self.page_args(self.page + 1) if self.has_next else None
+
+    def iter_pages(self):
+        start = max(1, self.page - WINDOW)
+        if start > 1:
+            yield 1, {}
+            if start > 2:
+                yield None, None
+        for number in range(start, self.pages + 1):
+            yield number, self.page_args(number)
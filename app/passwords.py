@@ -0,0 +1,84 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from threading import BoundedSemaphore, Lock
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+# Хеширование и проверка паролей в отдельном пуле процессов, чтобы CPU-затратные
+# scrypt/PBKDF2 не занимали воркер приложения. Очередь ограничена: если в работе
+# уже PASSWORD_QUEUE_LIMIT задач, новая сразу отклоняется с PasswordServiceBusy.
+# Задача, не выполненная за PASSWORD_TIMEOUT секунд, тоже дает PasswordServiceBusy.
+# PASSWORD_WORKERS = 0 отключает пул (вычисления в текущем процессе)
+
+class PasswordServiceBusy(Exception):
+    pass
+
+
+_executor = None
+_slots = None
+_canonical_methods = {}
+_lock = Lock()
+
+
+def _config():
+    config = current_app.config
+    workers = config.get('PASSWORD_WORKERS', min(4, os.cpu_count() or 1))
+    return {
+        'method': config.get('PASSWORD_HASH_METHOD', 'scrypt'),
+        'workers': workers,
+        'queue_limit': config.get('PASSWORD_QUEUE_LIMIT', max(1, workers) * 8),
+        'timeout': config.get('PASSWORD_TIMEOUT', 10),
+    }
+
+
+def _get_pool(config):
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=config['workers'])
+            _slots = BoundedSemaphore(config['queue_limit'])
+        return _executor, _slots
+
+
+def _run(func, *args):
+    config = _config()
+    if not config['workers']:
+        return func(*args)
+    executor, slots = _get_pool(config)
+    if not slots.acquire(blocking=False):
+        raise PasswordServiceBusy()
+    # Место в очереди освобождается, когда задача действительно завершилась,
+    # а не когда запрос перестал ее ждать по таймауту
+    try:
+        future = executor.submit(func, *args)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=config['timeout'])
+    except FutureTimeoutError:
+        future.cancel()
+        raise PasswordServiceBusy() from None
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, _config()['method'])
+
+
+def verify_password(password_hash, password):
+    return _run(check_password_hash, password_hash, password)
+
+
+# Полное описание метода с параметрами, как оно записывается в начало хеша
+# (например, 'scrypt:32768:8:1' для 'scrypt'); вычисляется один раз для метода
+def _canonical_method(method):
+    if method not in _canonical_methods:
+        _canonical_methods[method] = generate_password_hash('', method).split('$', 1)[0]
+    return _canonical_methods[method]
+
+
+# Хеш создан с другими параметрами, чем заданы сейчас в PASSWORD_HASH_METHOD
+def needs_rehash(password_hash):
+    return password_hash.split('$', 1)[0] != _canonical_method(_config()['method'])
@@ -0,0 +1,142 @@
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import re
+import time
+from datetime import datetime
+from threading import Lock
+from flask import Blueprint, abort, current_app, g, render_template, request, send_from_directory
+from flask_login import login_required
+from books import admin_or_moderator
+
+bp = Blueprint('profiles', __name__, url_prefix='/profiles')
+
+# Профилирование запросов через cProfile. Профилируется доля PROFILE_SAMPLE_RATE
+# запросов (0 - выключено) и любой запрос с заголовком X-Profile, равным PROFILE_SECRET.
+# Результат сохраняется в PROFILE_DIR файлом pstats с именем
+# <время>_<маршрут>_<длительность>ms.pstats; открыть его можно pstats, snakeviz
+# или перевести во flamegraph (flameprof, gprof2dot). Хранятся последние PROFILE_KEEP файлов.
+# В процессе одновременно профилируется не больше одного запроса
+
+PROFILE_HEADER = 'X-Profile'
+SORT_KEYS = ('cumulative', 'tottime', 'calls')
+PROFILE_NAME = re.compile(r'^(\d{8}T\d{6}\.\d{6})_([\w.-]+)_(\d+)ms\.pstats$')
+
+_active = Lock()
+
+
+def profile_dir():
+    return current_app.config.get('PROFILE_DIR', os.path.join(current_app.instance_path, 'profiles'))
+
+
+def _requested():
+    secret = current_app.config.get('PROFILE_SECRET')
+    header = request.headers.get(PROFILE_HEADER)
+    if secret and header and hmac.compare_digest(header, secret):
+        return True
+    rate = current_app.config.get('PROFILE_SAMPLE_RATE', 0)
+    return rate > 0 and random.random() < rate
+
+
+def _start_profile():
+    if request.blueprint == bp.name or not _requested():
+        return
+    if not _active.acquire(blocking=False):
+        return
+    g.profiler = cProfile.Profile()
+    g.profile_started = time.perf_counter()
+    g.profiler.enable()
+
+
+def _finish_profile(response):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+    try:
+        profiler.disable()
+        elapsed_ms = int((time.perf_counter() - g.profile_started) * 1000)
+        root = profile_dir()
+        os.makedirs(root, exist_ok=True)
+        endpoint = re.sub(r'[^\w.-]', '_', request.endpoint or 'unmatched')
+        name = f'{datetime.now():%Y%m%dT%H%M%S.%f}_{endpoint}_{elapsed_ms}ms.pstats'
+        profiler.dump_stats(os.path.join(root, name))
+        _cleanup(root, current_app.config.get('PROFILE_KEEP', 200))
+    finally:
+        _active.release()
+    return response
+
+
+def _cleanup(root, keep):
+    names = sorted(name for name in os.listdir(root) if PROFILE_NAME.match(name))
+    for name in names[:-keep]:
+        os.remove(os.path.join(root, name))
+
+
+def init_profiling(app):
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+
+    # Если обработчик завершился исключением, after_request не вызывается,
+    # но профилировщик нужно остановить и освободить
+    @app.teardown_request
+    def stop_profile(exc):
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            _active.release()
+
+
+def list_profiles(root):
+    if not os.path.isdir(root):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(root), reverse=True):
+        match = PROFILE_NAME.match(name)
+        if match:
+            profiles.append({
+                'name': name,
+                'created': datetime.strptime(match.group(1), '%Y%m%dT%H%M%S.%f'),
+                'endpoint': match.group(2),
+                'duration': int(match.group(3)),
+            })
+    return profiles
+
+
+def _profile_path(name):
+    if not PROFILE_NAME.match(name):
+        abort(404)
+    root = profile_dir()
+    if not os.path.exists(os.path.join(root, name)):
+        abort(404)
+    return root
+
+
+# Список последних профилей
+@bp.route('/')
+@login_required
+@admin_or_moderator('admin')
+def index():
+    return render_template('profiles.html', profiles=list_profiles(profile_dir()))
+
+
+# Функции профиля, отсортированные по суммарному времени (первые 40)
+@bp.route('/<name>')
+@login_required
+@admin_or_moderator('admin')
+def view(name):
+    root = _profile_path(name)
+    output = io.StringIO()
+    stats = pstats.Stats(os.path.join(root, name), stream=output)
+    sort = request.args.get('sort', 'cumulative')
+    stats.strip_dirs().sort_stats(sort if sort in SORT_KEYS else 'cumulative').print_stats(40)
+    return render_template('profiles.html', name=name, report=output.getvalue())
+
+
+@bp.route('/<name>/download')
+@login_required
+@admin_or_moderator('admin')
+def download(name):
+    return send_from_directory(_profile_path(name), name, as_attachment=True)
@@ -0,0 +1,202 @@
+import bisect
+import heapq
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from threading import Lock
+from sqlalchemy import func, select
+from models import db, BookStats, Review
+
+
+# Первые size ключей по убыванию оценки. Оценки всех ключей хранятся в словаре,
+# а отсортированный список первых size поддерживается при каждом изменении
+# (bisect, O(size)). Список пересчитывается целиком (heapq.nlargest по словарю),
+# только когда ключ из первых size опустился ниже последнего из них или удален:
+# следующий за ним кандидат заранее неизвестен. При равных оценках выше ключ
+# с меньшим номером
+class TopScores:
+    def __init__(self, size):
+        self.size = size
+        self.scores = {}
+        self._top = None
+
+    @staticmethod
+    def _entry(key, score):
+        return (score, -key)
+
+    def set(self, key, score):
+        if score is None:
+            self.remove(key)
+            return
+        old = self.scores.get(key)
+        self.scores[key] = score
+        if self._top is None:
+            return
+        entry = self._entry(key, score)
+        if old is not None:
+            old_entry = self._entry(key, old)
+            index = bisect.bisect_left(self._top, old_entry)
+            if index < len(self._top) and self._top[index] == old_entry:
+                del self._top[index]
+                # Ключ был среди первых: если он опустился ниже оставшихся,
+                # на его место может претендовать ключ не из списка
+                if len(self.scores) > self.size and (not self._top or entry < self._top[0]):
+                    self._top = None
+                    return
+                bisect.insort(self._top, entry)
+                return
+        if len(self._top) < self.size:
+            bisect.insort(self._top, entry)
+        elif entry > self._top[0]:
+            bisect.insort(self._top, entry)
+            del self._top[0]
+
+    def remove(self, key):
+        old = self.scores.pop(key, None)
+        if old is None or self._top is None:
+            return
+        old_entry = self._entry(key, old)
+        index = bisect.bisect_left(self._top, old_entry)
+        if index < len(self._top) and self._top[index] == old_entry:
+            del self._top[index]
+            if len(self.scores) >= self.size:
+                self._top = None
+
+    # Первые n пар (key, score), n не больше size
+    def top(self, n):
+        if self._top is None:
+            self._top = sorted(heapq.nlargest(self.size, (self._entry(key, score) for key, score in self.scores.items())))
+        return [(-key, score) for score, key in reversed(self._top[-n:])] if n > 0 else []
+
+
+# Рейтинги книг: лучшие по байесовской средней оценке, самые обсуждаемые (по числу
+# рецензий) и популярные сейчас (по числу рецензий за последние RANKING_TRENDING_DAYS
+# дней). Счетчики строятся из book_stats и reviews при первом обращении в процессе,
+# обновляются маршрутами write_review и delete_book и целиком перестраиваются не
+# реже чем раз в RANKINGS_TTL секунд, чтобы подхватить изменения других воркеров.
+# Страница рейтинга (/rankings/<kind>) читает готовые первые RANKING_SIZE книг,
+# без сортировки таблицы.
+#
+# Байесовская средняя: (C * m + сумма оценок) / (C + число рецензий), где m - средняя
+# оценка по всем рецензиям, C - RANKING_PRIOR_WEIGHT. Книга с парой высоких оценок
+# не обгоняет книгу с сотней чуть меньших. m фиксируется при построении: иначе каждая
+# рецензия меняла бы оценку всех книг, а за время между перестроениями m почти не меняется
+class BookRankings:
+    KINDS = ('rating', 'reviews', 'trending')
+
+    def __init__(self, size=100, prior_weight=10, trending_days=7, ttl=300):
+        self.size = size
+        self.prior_weight = prior_weight
+        self.trending_days = trending_days
+        self.ttl = ttl
+        self.built_at = None
+        self._lock = Lock()
+        self._reset()
+
+    def _reset(self):
+        self.stats = {}
+        self.mean = 0
+        self.recent = deque()
+        self.recent_counts = {}
+        self.clock_offset = timedelta()
+        self.rankings = {kind: TopScores(self.size) for kind in self.KINDS}
+
+    # Время по часам базы: created_at рецензий заполняет СУБД (server_default now()),
+    # а ее часовой пояс может не совпадать с часовым поясом приложения
+    def _now(self):
+        return datetime.now() + self.clock_offset
+
+    def _bayesian(self, count, rating_sum):
+        if not count:
+            return None
+        return (self.prior_weight * self.mean + rating_sum) / (self.prior_weight + count)
+
+    def build(self):
+        stats = {
+            id_book: (count or 0, rating_sum or 0)
+            for id_book, count, rating_sum in db.session.execute(
+                select(BookStats.id_book, BookStats.review_count, BookStats.rating_sum)
+            )
+        }
+        db_now = db.session.scalar(select(func.now()))
+        clock_offset = db_now - datetime.now()
+        since = db_now - timedelta(days=self.trending_days)
+        recent = deque(db.session.execute(
+            select(Review.created_at, Review.id_book).where(Review.created_at >= since).order_by(Review.created_at)
+        ).tuples())
+        with self._lock:
+            self._reset()
+            self.stats = stats
+            self.clock_offset = clock_offset
+            total = sum(count for count, _ in stats.values())
+            self.mean = sum(rating_sum for _, rating_sum in stats.values()) / total if total else 0
+            for id_book, (count, rating_sum) in stats.items():
+                self.rankings['rating'].set(id_book, self._bayesian(count, rating_sum))
+                self.rankings['reviews'].set(id_book, count or None)
+            self.recent = recent
+            for _, id_book in recent:
+                self.recent_counts[id_book] = self.recent_counts.get(id_book, 0) + 1
+            for id_book, count in self.recent_counts.items():
+                self.rankings['trending'].set(id_book, count)
+            self.built_at = time.monotonic()
+
+    def ensure_built(self):
+        if self.built_at is None or time.monotonic() - self.built_at > self.ttl:
+            self.build()
+
+    # Рецензии, вышедшие за окно популярности, вычитаются из счетчиков
+    def _expire(self):
+        since = self._now() - timedelta(days=self.trending_days)
+        trending = self.rankings['trending']
+        while self.recent and self.recent[0][0] < since:
+            _, id_book = self.recent.popleft()
+            if id_book not in self.recent_counts:
+                continue
+            count = self.recent_counts[id_book] - 1
+            if count:
+                self.recent_counts[id_book] = count
+            else:
+                del self.recent_counts[id_book]
+            trending.set(id_book, count or None)
+
+    def add_review(self, id_book, rating):
+        if self.built_at is None:
+            return
+        with self._lock:
+            count, rating_sum = self.stats.get(id_book, (0, 0))
+            count, rating_sum = count + 1, rating_sum + rating
+            self.stats[id_book] = (count, rating_sum)
+            self.rankings['rating'].set(id_book, self._bayesian(count, rating_sum))
+            self.rankings['reviews'].set(id_book, count)
+            self.recent.append((self._now(), id_book))
+            self.recent_counts[id_book] = self.recent_counts.get(id_book, 0) + 1
+            self.rankings['trending'].set(id_book, self.recent_counts[id_book])
+
+    # Рецензии удаленной книги остаются в окне популярности до истечения,
+    # но сама книга из рейтингов убирается сразу
+    def remove_book(self, id_book):
+        if self.built_at is None:
+            return
+        with self._lock:
+            self.stats.pop(id_book, None)
+            self.recent_counts.pop(id_book, None)
+            for ranking in self.rankings.values():
+                ranking.remove(id_book)
+
+    # Первые n пар (id_book, оценка) рейтинга kind
+    def top(self, kind, n):
+        self.ensure_built()
+        with self._lock:
+            if kind == 'trending':
+                self._expire()
+            return self.rankings[kind].top(min(n, self.size))
+
+
+rankings = BookRankings()
+
+
+def init_rankings(app):
+    rankings.size = app.config.get('RANKING_SIZE', 100)
+    rankings.prior_weight = app.config.get('RANKING_PRIOR_WEIGHT', 10)
+    rankings.trending_days = app.config.get('RANKING_TRENDING_DAYS', 7)
+    rankings.ttl = app.config.get('RANKINGS_TTL', 300)
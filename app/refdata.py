@@ -0,0 +1,90 @@
+import time
+from collections import namedtuple
+from threading import Lock
+from sqlalchemy import event, update, insert, select
+from sqlalchemy.exc import IntegrityError
+from models import db, Genres, CacheVersions
+
+Genre = namedtuple('Genre', 'id_genre name_genre')
+
+
+# Кэш небольшой справочной таблицы в памяти процесса. Актуальность проверяется
+# по счетчику версии в таблице cache_versions, общей для всех воркеров: не чаще
+# одного раза в check_interval секунд читается одна строка по первичному ключу,
+# и только если версия изменилась, таблица загружается заново
+class ReferenceCache:
+    def __init__(self, name, loader, check_interval=30):
+        self.name = name
+        self.loader = loader
+        self.check_interval = check_interval
+        self._data = None
+        self._version = None
+        self._checked_at = 0
+        self._lock = Lock()
+
+    def get(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._data is not None and now - self._checked_at < self.check_interval:
+                return self._data
+        version = read_version(self.name)
+        with self._lock:
+            if self._data is None or version != self._version:
+                self._data = self.loader()
+                self._version = version
+            self._checked_at = now
+            return self._data
+
+    def invalidate(self):
+        with self._lock:
+            self._data = None
+
+
+def _load_genres():
+    return [Genre(*row) for row in db.session.query(Genres.id_genre, Genres.name_genre).order_by(Genres.id_genre)]
+
+
+genres_cache = ReferenceCache('genres', _load_genres)
+
+
+def init_refdata(app):
+    genres_cache.check_interval = app.config.get('REFDATA_CHECK_INTERVAL', 30)
+
+
+def get_genres():
+    return genres_cache.get()
+
+
+def get_genre_names():
+    return {genre.id_genre: genre.name_genre for genre in genres_cache.get()}
+
+
+def read_version(name):
+    return db.session.execute(select(CacheVersions.version).filter_by(name=name)).scalar_one_or_none() or 0
+
+
+# Увеличение версии справочника в текущей транзакции. Остальные процессы
+# заметят изменение при следующей проверке версии. Строки версий создаются
+# миграцией; если строки нет, она добавляется, а если ее одновременно добавил
+# другой процесс (IntegrityError), версия увеличивается повторным UPDATE
+def bump_version(connection, name):
+    increment = update(CacheVersions).filter_by(name=name).values(version=CacheVersions.version + 1)
+    if connection.execute(increment).rowcount:
+        return
+    try:
+        with connection.begin_nested():
+            connection.execute(insert(CacheVersions).values(name=name, version=1))
+    except IntegrityError:
+        connection.execute(increment)
+
+
+# Любое изменение справочника через ORM увеличивает его версию
+def _watch(model, cache):
+    def on_change(mapper, connection, target):
+        bump_version(connection, cache.name)
+        cache.invalidate()
+    for event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, event_name, on_change)
+
+
+_watch(Genres, genres_cache)
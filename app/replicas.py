@@ -0,0 +1,97 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+# Чтение с реплик базы данных. Реплики задаются списком REPLICA_URIS и подключаются
+# как binds replica_0, replica_1, ... SELECT-запросы GET/HEAD-запросов (страницы,
+# JSON API, выгрузки) и блока read_replica() идут на случайную реплику, все
+# остальное - на основную базу. После запроса, изменившего данные (POST и т.п.
+# с commit), пользователь REPLICA_STICKY_SECONDS секунд читает с основной базы,
+# чтобы сразу видеть свои изменения, даже если реплика отстает.
+# Страницы в кэше (page_cache.py), собранные по реплике, могут отставать на
+# величину задержки репликации
+#
+# Параметры пула соединений для всех баз: DB_POOL_SIZE, DB_MAX_OVERFLOW,
+# DB_POOL_TIMEOUT, DB_POOL_RECYCLE (по умолчанию 3600 с), DB_POOL_PRE_PING (True)
+
+STICKY_KEY = 'primary_until'
+
+_settings = {'replicas': []}
+_force_replica = ContextVar('force_replica', default=False)
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _settings['replicas'] and not self._flushing and _is_read(clause) and _reads_from_replica():
+            return self._db.engines[random.choice(_settings['replicas'])]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _is_read(clause):
+    return getattr(clause, 'is_select', False) and getattr(clause, '_for_update_arg', None) is None
+
+
+def _reads_from_replica():
+    if _force_replica.get():
+        return True
+    if not has_request_context() or request.method not in ('GET', 'HEAD'):
+        return False
+    # Сессия читается только при первом запросе к базе, чтобы ответы без обращения
+    # к базе (например, файлы обложек) не получали Vary: Cookie
+    if 'use_primary' not in g:
+        g.use_primary = session.get(STICKY_KEY, 0) > time.time()
+    return not g.use_primary
+
+
+# Чтение с реплик вне HTTP-запроса (например, в командах выгрузки)
+@contextmanager
+def read_replica():
+    token = _force_replica.set(True)
+    try:
+        yield
+    finally:
+        _force_replica.reset(token)
+
+
+def _engine_options(config):
+    options = {
+        'pool_pre_ping': config.get('DB_POOL_PRE_PING', True),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', 3600),
+    }
+    for key, option in (('DB_POOL_SIZE', 'pool_size'), ('DB_MAX_OVERFLOW', 'max_overflow'), ('DB_POOL_TIMEOUT', 'pool_timeout')):
+        if key in config:
+            options[option] = config[key]
+    return options
+
+
+# Вызывается до db.init_app: дополняет конфигурацию пулов и binds реплик
+def init_replicas(app):
+    options = _engine_options(app.config)
+    engine_options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    for key, value in options.items():
+        engine_options.setdefault(key, value)
+
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    replicas = []
+    for i, uri in enumerate(app.config.get('REPLICA_URIS', [])):
+        key = f'replica_{i}'
+        binds[key] = {'url': uri, **engine_options}
+        replicas.append(key)
+    _settings['replicas'] = replicas
+    sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', 10)
+
+    @app.after_request
+    def set_sticky(response):
+        if replicas and g.get('db_committed'):
+            session[STICKY_KEY] = time.time() + sticky_seconds
+        return response
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _after_commit(db_session):
+    if has_request_context() and request.method not in ('GET', 'HEAD'):
+        g.db_committed = True
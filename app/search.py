@@ -0,0 +1,94 @@
+import re
+from sqlalchemy import text, func, literal_column, table, column
+from sqlalchemy.dialects.mysql import match
+from models import db, Books
+
+# Полнотекстовый поиск по названию, автору, издателю и описанию книги.
+# В MySQL используется FULLTEXT-индекс ft_books_search на таблице books (его InnoDB
+# поддерживает сам), в SQLite - отдельная виртуальная таблица FTS5 books_fts,
+# rowid которой совпадает с id_book; ее содержимое обновляют маршруты книг
+
+FTS_TABLE = 'books_fts'
+SEARCH_COLUMNS = ('name_book', 'author', 'publisher', 'short_description')
+fts_table = table(FTS_TABLE, column('rowid'))
+
+
+def _is_sqlite():
+    return db.engine.dialect.name == 'sqlite'
+
+
+# Поисковая строка FTS5: каждое слово в кавычках с поиском по префиксу,
+# чтобы служебный синтаксис FTS5 во вводе пользователя не ломал запрос
+def _fts5_query(query):
+    words = re.findall(r'\w+', query)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+# Добавление к запросу каталога условия поиска и сортировки по релевантности.
+# Возвращает None, если в строке нет ни одного слова
+def apply_search(books_query, query):
+    if _is_sqlite():
+        fts_query = _fts5_query(query)
+        if not fts_query:
+            return None
+        fts = literal_column(FTS_TABLE)
+        return (
+            books_query
+            .join(fts_table, fts_table.c.rowid == Books.id_book)
+            .filter(fts.op('MATCH')(fts_query))
+            .order_by(func.bm25(fts), Books.id_book.desc())
+        )
+
+    if not query.strip():
+        return None
+    relevance = match(
+        Books.name_book, Books.author, Books.publisher, Books.short_description,
+        against=query
+    ).in_natural_language_mode()
+    return books_query.filter(relevance > 0).order_by(relevance.desc(), Books.id_book.desc())
+
+
+# Обновление записи книги в индексе. Вызывается до commit, в той же транзакции
+def index_book(book):
+    if not _is_sqlite():
+        return
+    remove_book(book.id_book)
+    db.session.execute(
+        text(f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(SEARCH_COLUMNS)}) '
+             'VALUES (:id_book, :name_book, :author, :publisher, :short_description)'),
+        {'id_book': book.id_book, **{column: getattr(book, column) for column in SEARCH_COLUMNS}}
+    )
+
+
+# Добавление в индекс новых книг (словари с id_book и полями поиска) одним executemany
+def index_new_books(rows):
+    if not _is_sqlite() or not rows:
+        return
+    db.session.execute(
+        text(f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(SEARCH_COLUMNS)}) '
+             'VALUES (:id_book, :name_book, :author, :publisher, :short_description)'),
+        [{'id_book': row['id_book'], **{column: row[column] for column in SEARCH_COLUMNS}} for row in rows]
+    )
+
+
+def remove_book(id_book):
+    if not _is_sqlite():
+        return
+    db.session.execute(text(f'DELETE FROM {FTS_TABLE} WHERE rowid = :id_book'), {'id_book': id_book})
+
+
+# Полное перестроение индекса
+def rebuild_index():
+    if _is_sqlite():
+        columns = ', '.join(SEARCH_COLUMNS)
+        db.session.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5({columns}, tokenize='unicode61')"
+        ))
+        db.session.execute(text(f'DELETE FROM {FTS_TABLE}'))
+        db.session.execute(text(f'INSERT INTO {FTS_TABLE} (rowid, {columns}) SELECT id_book, {columns} FROM books'))
+    else:
+        db.session.execute(text(
+            f'ALTER TABLE books DROP INDEX ft_books_search, '
+            f'ADD FULLTEXT INDEX ft_books_search ({", ".join(SEARCH_COLUMNS)})'
+        ))
+    db.session.commit()
@@ -0,0 +1,54 @@
+'use strict';
+
+// Подгрузка следующих страниц рецензий: блок "Показать еще" заменяется фрагментом
+// со следующей страницей (в нем своя ссылка на продолжение). Страница грузится при
+// нажатии на ссылку или когда блок появляется в области видимости
+function loadMoreReviews(block) {
+  if (block.dataset.loading) {
+    return;
+  }
+  block.dataset.loading = '1';
+  let link = block.querySelector('a');
+  fetch(link.href)
+    .then(response => {
+      if (!response.ok) {
+        throw new Error(response.statusText);
+      }
+      return response.text();
+    })
+    .then(html => {
+      let container = block.parentElement;
+      block.insertAdjacentHTML('afterend', html);
+      block.remove();
+      let next = container.querySelector('[data-reviews-more]');
+      if (next) {
+        watchReviews(next);
+      }
+    })
+    .catch(() => {
+      delete block.dataset.loading;
+    });
+}
+
+let reviewsObserver = 'IntersectionObserver' in window
+  ? new IntersectionObserver(entries => {
+      for (let entry of entries) {
+        if (entry.isIntersecting) {
+          reviewsObserver.unobserve(entry.target);
+          loadMoreReviews(entry.target);
+        }
+      }
+    }, { rootMargin: '200px' })
+  : null;
+
+function watchReviews(block) {
+  block.querySelector('a').addEventListener('click', event => {
+    event.preventDefault();
+    loadMoreReviews(block);
+  });
+  if (reviewsObserver) {
+    reviewsObserver.observe(block);
+  }
+}
+
+document.querySelectorAll('#reviews [data-reviews-more]').forEach(watchReviews);
@@ -0,0 +1,48 @@
+from models import db, BookStats
+from refdata import get_genre_names
+from sqlalchemy import update, delete, func
+
+
+# Строка жанров для карточки книги, в том же виде, что раньше давал group_concat.
+# Названия жанров берутся из кэша справочника
+def genres_label(genre_ids):
+    names = get_genre_names()
+    return ','.join(names[id_genre] for id_genre in sorted(set(genre_ids)) if id_genre in names)
+
+
+# Создание строки статистики для новой книги. Вызывается до commit,
+# чтобы книга и её статистика попали в базу одной транзакцией
+def create_book_stats(id_book, genre_ids):
+    stats = BookStats(id_book=id_book, review_count=0, rating_sum=0, avg_rating=None, genres=genres_label(genre_ids))
+    db.session.add(stats)
+    return stats
+
+
+# Обновление строки жанров после редактирования книги
+def update_book_genres(id_book, genre_ids):
+    db.session.execute(
+        update(BookStats)
+        .where(BookStats.id_book == id_book)
+        .values(genres=genres_label(genre_ids))
+    )
+
+
+# Учет новой рецензии. Счетчики увеличиваются выражением в самом UPDATE,
+# поэтому параллельные рецензии не теряют друг друга, а средняя оценка
+# пересчитывается вторым запросом из уже обновленных значений
+def add_review_rating(id_book, rating):
+    db.session.execute(
+        update(BookStats)
+        .where(BookStats.id_book == id_book)
+        .values(review_count=BookStats.review_count + 1, rating_sum=BookStats.rating_sum + rating)
+    )
+    db.session.execute(
+        update(BookStats)
+        .where(BookStats.id_book == id_book, BookStats.review_count > 0)
+        .values(avg_rating=func.round(BookStats.rating_sum * 1.0 / BookStats.review_count, 1))
+    )
+
+
+# Удаление статистики вместе с книгой (на случай, если СУБД не выполняет ON DELETE CASCADE)
+def delete_book_stats(id_book):
+    db.session.execute(delete(BookStats).where(BookStats.id_book == id_book))
@@ -0,0 +1,55 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Приложение создается один раз на прогон с временной базой SQLite (config.py
+# читается при импорте app). Каждый модуль тестов получает пустую схему
+# и сброшенные кэши процесса и сам заполняет нужные данные
+
+
+@pytest.fixture(scope='session')
+def flask_app():
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    os.environ['FLASK_SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    os.environ['FLASK_PAGE_CACHE_ENABLED'] = 'false'
+    sys.path.insert(0, APP_DIR)
+    from app import app
+
+    app.testing = True
+    yield app
+    from models import db
+    with app.app_context():
+        db.engine.dispose()
+    os.remove(path)
+
+
+def reset_caches():
+    import auth
+    import covers
+    import pagination
+    from facets import GenreIndex, genre_index
+    from refdata import genres_cache
+
+    fresh = GenreIndex(genre_index.ttl)
+    genre_index.__dict__.update({key: value for key, value in fresh.__dict__.items() if key != '_lock'})
+    genres_cache.invalidate()
+    auth._user_cache.clear()
+    auth._user_version.update(version=None, checked_at=0)
+    covers._variants.clear()
+    pagination._count_cache.clear()
+
+
+@pytest.fixture(scope='module')
+def app(flask_app):
+    from models import db
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+    reset_caches()
+    yield flask_app
+    reset_caches()
@@ -0,0 +1,58 @@
+import pytest
+
+# Условные GET в API: список книг проверяется только по ETag, в который входят
+# книги страницы, поэтому удаление книги с предыдущей страницы меняет ответ.
+# Книга отдает и ETag, и Last-Modified
+
+BOOKS = 5
+
+
+@pytest.fixture(scope='module')
+def seeded(app):
+    from models import db, Books, BookStats, Covers
+
+    with app.app_context():
+        db.session.add(Covers(id_cover=1, filename='c', mimetype='jpg', md5_hash='0' * 32))
+        for id_book in range(1, BOOKS + 1):
+            db.session.add(Books(id_book=id_book, name_book=f'Книга {id_book}', short_description='Описание',
+                                 year=2000 + id_book, publisher='Издательство', author='Автор', pages=100, id_cover=1))
+            db.session.add(BookStats(id_book=id_book))
+        db.session.commit()
+    return app
+
+
+def ids(response):
+    return [item['id_book'] for item in response.get_json()['items']]
+
+
+def test_book_list_is_validated_by_etag_only(seeded):
+    from models import db, Books
+    from pagination import invalidate_count
+
+    client = seeded.test_client()
+    url = '/api/v1/books?per_page=2&page=2'
+    response = client.get(url)
+    assert ids(response) == [3, 2]
+    assert response.last_modified is None
+    etag = response.headers['ETag']
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    # Книга с первой страницы удалена: страница 2 сдвигается, хотя оставшиеся книги не менялись
+    with seeded.app_context():
+        db.session.delete(db.session.get(Books, 4))
+        db.session.commit()
+        invalidate_count('books')
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert ids(response) == [2, 1]
+    assert client.get(url, headers={'If-Modified-Since': 'Sun, 01 Jan 2040 00:00:00 GMT'}).status_code == 200
+
+
+def test_book_not_modified(seeded):
+    client = seeded.test_client()
+    response = client.get('/api/v1/books/1')
+    assert response.status_code == 200
+    assert response.last_modified is not None
+    assert client.get('/api/v1/books/1', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    headers = {'If-Modified-Since': response.headers['Last-Modified']}
+    assert client.get('/api/v1/books/1', headers=headers).status_code == 304
@@ -0,0 +1,84 @@
+import io
+
+import pytest
+from sqlalchemy import select
+
+# Сборка мусора обложек удаляет только обложки без книг вместе с их файлами.
+# Книга, сославшаяся на обложку после выборки пачки, обложку сохраняет
+
+
+def md5(n):
+    return f'{n:032x}'
+
+
+@pytest.fixture
+def storage(app):
+    from cover_storage import MemoryStorage, cover_key
+    from models import db, Books, Covers
+
+    storage = MemoryStorage()
+    with app.app_context():
+        db.session.execute(Books.__table__.delete())
+        db.session.execute(Covers.__table__.delete())
+        for id_cover in (1, 2, 3):
+            db.session.add(Covers(id_cover=id_cover, filename=md5(id_cover), mimetype='jpg', md5_hash=md5(id_cover)))
+            storage.write(cover_key(md5(id_cover), 'jpg'), io.BytesIO(b'jpg'))
+            storage.write(cover_key(md5(id_cover), 'webp', 'thumb'), io.BytesIO(b'webp'))
+        db.session.add(Books(id_book=1, name_book='Книга', short_description='Описание', year=2000,
+                             publisher='Издательство', author='Автор', pages=100, id_cover=1))
+        db.session.commit()
+    return storage
+
+
+def cover_ids():
+    from models import db, Covers
+    return list(db.session.execute(select(Covers.id_cover).order_by(Covers.id_cover)).scalars())
+
+
+def test_deletes_unused_covers_and_files(app, storage):
+    from covers import delete_unused_covers
+    from cover_storage import cover_key
+
+    with app.app_context():
+        assert delete_unused_covers(storage, 1) == 2
+        assert cover_ids() == [1]
+    assert storage.exists(cover_key(md5(1), 'jpg'))
+    assert storage.exists(cover_key(md5(1), 'webp', 'thumb'))
+    assert not storage.exists(cover_key(md5(2), 'jpg'))
+    assert not storage.exists(cover_key(md5(3), 'webp', 'thumb'))
+
+
+# Выборка пачки устарела (как при чтении подзапроса без блокировки): в нее попала
+# обложка, на которую уже ссылается книга. DELETE проверяет книги сам
+def test_keeps_cover_used_after_selection(app, storage, monkeypatch):
+    import covers
+    from cover_storage import cover_key
+    from models import db, Books, Covers
+
+    stale = select(Covers.id_cover, Covers.md5_hash, Covers.mimetype).order_by(Covers.id_cover)
+    monkeypatch.setattr(covers, 'unused_covers_query', lambda limit: stale.limit(limit))
+    with app.app_context():
+        assert covers.delete_unused_covers(storage, 10) == 2
+        assert cover_ids() == [1]
+        assert db.session.get(Books, 1) is not None
+    assert storage.exists(cover_key(md5(1), 'jpg'))
+
+
+# Изображение загружено снова после удаления обложки: новая обложка с тем же md5
+# использует те же ключи хранилища, и ее файлы не удаляются
+def test_keeps_files_of_reuploaded_cover(app, storage):
+    import covers
+    from cover_storage import cover_key
+    from models import db, Covers
+
+    with app.app_context():
+        deleted = db.session.execute(
+            select(Covers.id_cover, Covers.md5_hash, Covers.mimetype).where(Covers.id_cover.in_([2, 3]))
+        ).all()
+        db.session.execute(Covers.__table__.delete().where(Covers.id_cover.in_([2, 3])))
+        db.session.add(Covers(id_cover=4, filename=md5(2), mimetype='jpg', md5_hash=md5(2)))
+        db.session.commit()
+        covers._remove_deleted_files(storage, deleted)
+    assert storage.exists(cover_key(md5(2), 'jpg'))
+    assert storage.exists(cover_key(md5(2), 'webp', 'thumb'))
+    assert not storage.exists(cover_key(md5(3), 'jpg'))
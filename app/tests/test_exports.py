@@ -0,0 +1,74 @@
+import csv
+import io
+import json
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Выгрузка читается пачками по ключу: на BOOKS книг при пачке BATCH книг -
+# BOOKS // BATCH + 1 коротких запросов, а строки идут по возрастанию id_book
+
+BOOKS = 7
+BATCH = 3
+
+
+@pytest.fixture(scope='module')
+def seeded(app):
+    from models import db, Books, BookStats, Covers, Roles, Users
+
+    with app.app_context():
+        db.session.add(Roles(id_role=1, name_role='Администратор', description=''))
+        db.session.add(Users(id_user=1, name='Имя', lastname='Фамилия', login='admin', hash_pass='-', id_role=1))
+        db.session.add(Covers(id_cover=1, filename='c', mimetype='jpg', md5_hash='0' * 32))
+        for id_book in range(1, BOOKS + 1):
+            db.session.add(Books(id_book=id_book, name_book=f'Книга {id_book}', short_description='Описание',
+                                 year=2000, publisher='Издательство', author='Автор', pages=100, id_cover=1))
+            db.session.add(BookStats(id_book=id_book, genres='Роман'))
+        db.session.commit()
+    return app
+
+
+@pytest.fixture
+def admin(seeded, monkeypatch):
+    import exports
+    monkeypatch.setattr(exports, 'BATCH_SIZE', BATCH)
+    client = seeded.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+    return client
+
+
+# Тело выгрузки и запросы к таблице книг, выполненные при ее чтении
+def export(client, url):
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM books' in statement:
+            statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', on_execute)
+    try:
+        response = client.get(url)
+        body = response.get_data(as_text=True)
+    finally:
+        event.remove(Engine, 'before_cursor_execute', on_execute)
+    assert response.status_code == 200
+    return body, statements
+
+
+def test_books_csv_in_keyset_batches(admin):
+    body, statements = export(admin, '/export/books.csv')
+    rows = list(csv.reader(io.StringIO(body)))
+    assert rows[0][0] == 'id_book'
+    assert [int(row[0]) for row in rows[1:]] == list(range(1, BOOKS + 1))
+    assert len(statements) == BOOKS // BATCH + 1
+    assert all('LIMIT' in statement for statement in statements)
+
+
+def test_books_jsonl(admin):
+    body, _ = export(admin, '/export/books.jsonl')
+    rows = [json.loads(line) for line in body.splitlines()]
+    assert [row['id_book'] for row in rows] == list(range(1, BOOKS + 1))
+    assert rows[0]['genres'] == 'Роман'
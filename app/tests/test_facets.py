@@ -0,0 +1,100 @@
+import pytest
+
+# Фильтр каталога по жанрам (genre_index): режимы and/or, количество книг по жанрам
+# и постраничный вывод отфильтрованного каталога в порядке (year, id_book) по убыванию
+
+BOOKS = 18
+PER_PAGE = 2
+
+
+def year(id_book):
+    return 2000 + id_book // 5
+
+
+# Жанр 1 - четные книги, жанр 2 - кратные трем, жанр 3 - без книг
+def genres(id_book):
+    return [id_genre for id_genre, divisor in ((1, 2), (2, 3)) if id_book % divisor == 0]
+
+
+def catalog_order(ids):
+    return sorted(ids, key=lambda id_book: (year(id_book), id_book), reverse=True)
+
+
+def members(bits):
+    return {id_book for id_book in range(BOOKS + 2) if bits >> id_book & 1}
+
+
+@pytest.fixture(scope='module')
+def index(app):
+    from models import db, Books, BookStats, ConnectGenreBook, Covers, Genres
+    from facets import genre_index
+
+    with app.app_context():
+        db.session.add(Covers(id_cover=1, filename='c', mimetype='jpg', md5_hash='0' * 32))
+        db.session.add_all(Genres(id_genre=id_genre, name_genre=f'Жанр {id_genre}') for id_genre in (1, 2, 3))
+        for id_book in range(1, BOOKS + 1):
+            db.session.add(Books(id_book=id_book, name_book=f'Книга {id_book}', short_description='Описание',
+                                 year=year(id_book), publisher='Издательство', author='Автор', pages=100, id_cover=1))
+            db.session.add(BookStats(id_book=id_book))
+            db.session.add_all(ConnectGenreBook(id_book=id_book, id_genre=id_genre) for id_genre in genres(id_book))
+        db.session.commit()
+        yield genre_index
+
+
+def test_select_and_or(index):
+    even = {id_book for id_book in range(1, BOOKS + 1) if id_book % 2 == 0}
+    triple = {id_book for id_book in range(1, BOOKS + 1) if id_book % 3 == 0}
+    assert members(index.select([1, 2], 'and')) == even & triple
+    assert members(index.select([1, 2], 'or')) == even | triple
+    assert members(index.select([1, 3], 'and')) == set()
+    assert members(index.select([])) == set(range(1, BOOKS + 1))
+
+
+def test_counts(index):
+    assert index.counts() == {1: 9, 2: 6}
+    assert index.counts(index.select([2])) == {1: 3, 2: 6}
+
+
+# Страница по аргументам ссылки (page_args)
+def paginate(bits, args):
+    from books import catalog_query
+    from facets import GenrePagination
+
+    args = dict(args)
+    return GenrePagination(catalog_query(), bits, args.pop('page', 1), PER_PAGE, **args)
+
+
+def ids(pagination):
+    return [row.id_book for row in pagination.items]
+
+
+@pytest.mark.parametrize('selected, mode', [([1, 2], 'or'), ([1], 'and'), ([1, 2], 'and')])
+def test_pages_in_catalog_order(index, selected, mode):
+    bits = index.select(selected, mode)
+    expected = catalog_order(members(bits))
+
+    pagination = paginate(bits, {})
+    assert pagination.total == len(expected)
+    seen = ids(pagination)
+    while pagination.next_args:
+        pagination = paginate(bits, pagination.next_args)
+        seen += ids(pagination)
+    assert seen == expected
+
+    pagination = paginate(bits, {'page': 2, 'last': 1})
+    seen = ids(pagination)
+    while pagination.prev_args is not None:
+        pagination = paginate(bits, pagination.prev_args)
+        seen = ids(pagination) + seen
+    assert seen == expected
+
+
+def test_set_and_remove_book(index):
+    index.ensure_built()
+    index.set_book(1, 2100, [1, 3])
+    assert 1 in members(index.select([3]))
+    assert index.keys(index.select([1]), None, True, 0, 1) == [(2100, 1)]
+    index.remove_book(1)
+    assert 1 not in members(index.select([1], 'or'))
+    assert (2100, 1) not in index.order
+    index.build()
@@ -0,0 +1,108 @@
+import pytest
+
+# Пагинация каталога по ключу (year, id_book): проход по ссылкам "следующая"
+# и "предыдущая" через группы книг одного года, ссылки окна страниц (курсор
+# со skip, last) и номера страниц без курсора
+
+BOOKS = 23
+PER_PAGE = 3
+PAGES = 8
+
+
+def year(id_book):
+    return 2000 + id_book // 4
+
+
+# Ожидаемый порядок каталога: по убыванию года, внутри года - по убыванию id_book
+ORDER = sorted(range(1, BOOKS + 1), key=lambda id_book: (year(id_book), id_book), reverse=True)
+
+
+def expected(page):
+    return ORDER[(page - 1) * PER_PAGE:page * PER_PAGE]
+
+
+@pytest.fixture(scope='module')
+def paginate(app):
+    from models import db, Books, Covers
+    from pagination import KeysetPagination
+
+    with app.app_context():
+        db.session.add(Covers(id_cover=1, filename='c', mimetype='jpg', md5_hash='0' * 32))
+        for id_book in range(1, BOOKS + 1):
+            db.session.add(Books(id_book=id_book, name_book=f'Книга {id_book}', short_description='Описание',
+                                 year=year(id_book), publisher='Издательство', author='Автор', pages=100, id_cover=1))
+        db.session.commit()
+
+    def paginate(page=1, **args):
+        query = db.session.query(Books.id_book, Books.year)
+        return KeysetPagination(query, [Books.year, Books.id_book], page, PER_PAGE, BOOKS, **args)
+
+    with app.app_context():
+        yield paginate
+
+
+def ids(pagination):
+    return [row.id_book for row in pagination.items]
+
+
+def test_walk_forward(paginate):
+    pagination = paginate()
+    seen = ids(pagination)
+    while pagination.next_args:
+        pagination = paginate(**pagination.next_args)
+        assert ids(pagination) == expected(pagination.page)
+        seen += ids(pagination)
+    assert pagination.page == PAGES
+    assert seen == ORDER
+
+
+def test_walk_backward(paginate):
+    pagination = paginate(page=2, last=1)
+    assert pagination.page == PAGES
+    seen = ids(pagination)
+    while pagination.prev_args is not None:
+        args = pagination.prev_args
+        pagination = paginate(**args)
+        assert ids(pagination) == expected(pagination.page)
+        seen = ids(pagination) + seen
+    assert pagination.page == 1
+    assert not pagination.has_prev
+    assert seen == ORDER
+
+
+# Каждая ссылка окна страниц ведет на страницу со своим номером
+@pytest.mark.parametrize('page', range(1, PAGES + 1))
+def test_window_links(paginate, page):
+    current = paginate()
+    while current.page < page:
+        current = paginate(**current.next_args)
+    for number, args in current.iter_pages():
+        if number is not None:
+            assert ids(paginate(**args)) == expected(number), (page, number, args)
+
+
+def test_skip_is_limited_to_window(paginate):
+    from pagination import WINDOW
+
+    first = paginate()
+    args = dict(first.page_args(3), skip=100 * PER_PAGE)
+    pagination = paginate(**args)
+    assert pagination.current_args['skip'] == (WINDOW - 1) * PER_PAGE
+    assert ids(pagination) == expected(1 + WINDOW)
+
+
+# Номер страницы без курсора: в начальном окне и у конца выборки - через небольшой
+# OFFSET, остальные номера приводятся к последней странице начального окна
+@pytest.mark.parametrize('page, shown', [(2, 2), (3, 3), (5, 3), (6, 6), (8, 8), (50, 8)])
+def test_bare_page_numbers(paginate, page, shown):
+    pagination = paginate(page=page)
+    assert pagination.page == shown
+    assert ids(pagination) == expected(shown)
+
+
+def test_seek_condition_has_leading_bound(paginate):
+    from models import Books
+    from pagination import _seek_condition
+
+    condition = str(_seek_condition([Books.year, Books.id_book], [2003, 12], True).compile())
+    assert condition.startswith('books.year <= ')
@@ -0,0 +1,60 @@
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Число SQL-запросов страницы книги не должно зависеть от числа рецензий:
+# книга с одной рецензией и книга с несколькими страницами рецензий
+# отдаются одинаковым числом запросов, для гостя и для автора рецензии
+
+MANY_REVIEWS = 50
+
+
+@pytest.fixture(scope='module')
+def seeded(app):
+    from models import db, Books, BookStats, Covers, Review, Roles, Users
+
+    with app.app_context():
+        db.session.add(Roles(id_role=1, name_role='Пользователь', description=''))
+        db.session.add(Covers(id_cover=1, filename='c', mimetype='jpg', md5_hash='0' * 32))
+        db.session.add_all(
+            Users(id_user=i, name='Имя', lastname='Фамилия', login=f'user{i}', hash_pass='-', id_role=1)
+            for i in range(1, MANY_REVIEWS + 1)
+        )
+        for id_book, reviews in ((1, 1), (2, MANY_REVIEWS)):
+            db.session.add(Books(id_book=id_book, name_book=f'Книга {id_book}', short_description='Описание',
+                                 year=2000, publisher='Издательство', author='Автор', pages=100, id_cover=1))
+            db.session.add(BookStats(id_book=id_book, review_count=reviews, rating_sum=4 * reviews, avg_rating=4))
+            db.session.add_all(
+                Review(rating=4, text=f'Рецензия {i}', id_book=id_book, id_user=i) for i in range(1, reviews + 1)
+            )
+        db.session.commit()
+    return app
+
+
+def count_queries(client, url):
+    # Первый запрос прогревает кэши справочников и пользователей
+    assert client.get(url).status_code == 200
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', on_execute)
+    try:
+        assert client.get(url).status_code == 200
+    finally:
+        event.remove(Engine, 'before_cursor_execute', on_execute)
+    return len(statements)
+
+
+def test_query_count_does_not_depend_on_reviews(seeded):
+    client = seeded.test_client()
+    assert count_queries(client, '/books/view_books/1') == count_queries(client, '/books/view_books/2')
+
+
+def test_query_count_for_review_author(seeded):
+    client = seeded.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+    assert count_queries(client, '/books/view_books/1') == count_queries(client, '/books/view_books/2')
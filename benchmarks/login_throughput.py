@@ -0,0 +1,84 @@
+"""Пропускная способность входа в систему при параллельных запросах.
+
+Создает временную базу SQLite с пользователями и отправляет POST /auth/login
+из нескольких потоков через тестовый клиент Flask: сначала с проверкой пароля
+в текущем процессе (PASSWORD_WORKERS=0), затем через пул процессов.
+
+    python benchmarks/login_throughput.py --threads 16 --logins 400
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+
+
+def setup_app(db_path, users, method):
+    os.environ['FLASK_SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    os.environ['FLASK_PAGE_CACHE_ENABLED'] = 'false'
+    os.chdir(APP_DIR)
+    sys.path.insert(0, APP_DIR)
+    from app import app
+    from models import db, Roles, Users
+    from werkzeug.security import generate_password_hash
+
+    app.config['PASSWORD_HASH_METHOD'] = method
+    with app.app_context():
+        db.create_all()
+        db.session.add(Roles(id_role=3, name_role='Пользователь', description=''))
+        password_hash = generate_password_hash('password', method)
+        for i in range(users):
+            db.session.add(Users(name='Имя', lastname='Фамилия', login=f'user{i}', hash_pass=password_hash, id_role=3))
+        db.session.commit()
+    return app
+
+
+def run(app, threads, logins, users):
+    def login(i):
+        client = app.test_client()
+        started = time.perf_counter()
+        response = client.post('/auth/login', data={'login': f'user{i % users}', 'password': 'password'})
+        return response.status_code, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(login, range(logins)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for _, latency in results)
+    ok = sum(1 for status, _ in results if status == 302)
+    busy = sum(1 for status, _ in results if status == 503)
+    return {
+        'ok': ok,
+        'busy': busy,
+        'throughput': logins / elapsed,
+        'p50': latencies[len(latencies) // 2] * 1000,
+        'p95': latencies[int(len(latencies) * 0.95)] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--method', default='scrypt')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = setup_app(os.path.join(tmp, 'bench.db'), args.users, args.method)
+        for label, workers in (('inline', 0), (f'pool x{args.workers}', args.workers)):
+            app.config['PASSWORD_WORKERS'] = workers
+            app.config['PASSWORD_QUEUE_LIMIT'] = args.logins
+            result = run(app, args.threads, args.logins, args.users)
+            print(f'{label:>10}: {result["throughput"]:7.1f} logins/s  '
+                  f'p50 {result["p50"]:7.1f} ms  p95 {result["p95"]:7.1f} ms  '
+                  f'ok {result["ok"]}  busy {result["busy"]}')
+
+
+if __name__ == '__main__':
+    main()
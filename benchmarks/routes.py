@@ -0,0 +1,244 @@
+"""Нагрузочный бенчмарк основных страниц каталога.
+
+Заполняет базу синтетическими данными (см. seed_data.py; уже заполненная база
+используется повторно) и прогоняет сценарии через тестовый клиент Flask из
+нескольких потоков. Для каждого сценария выводятся p50/p95/p99 задержки,
+пропускная способность и среднее число SQL-запросов на запрос.
+Сценарии *_async обращаются к асинхронным версиям тех же страниц (/async/...),
+их удобно запускать рядом с синхронными:
+
+    python benchmarks/routes.py --scenario view_books --scenario view_books_async
+
+Результаты можно сохранить как базовые (--save-baseline) и сравнивать с ними
+последующие прогоны (--baseline): рост p95 больше чем на --tolerance процентов
+или рост числа запросов считается регрессией, и скрипт завершается с кодом 1.
+
+    python benchmarks/routes.py --books 100000 --reviews 2000000 --users 5000 \\
+        --save-baseline benchmarks/baselines/sqlite-100k.json
+    python benchmarks/routes.py --books 100000 --reviews 2000000 --users 5000 \\
+        --baseline benchmarks/baselines/sqlite-100k.json
+"""
+import argparse
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from seed_data import BENCH_PASSWORD, WORDS, load_app, seed
+
+SCENARIOS = (
+    'index', 'index_deep', 'index_last', 'index_genres', 'rankings', 'search', 'view_books', 'view_books_async',
+    'api_book', 'api_book_async', 'login', 'write_review',
+)
+
+
+# Число SQL-запросов из заголовка Server-Timing (instrumentation.py)
+def query_count(response):
+    for value in response.headers.getlist('Server-Timing'):
+        match = re.search(r'desc="(\d+) queries"', value)
+        if match:
+            return int(match.group(1))
+    return 0
+
+
+class Scenarios:
+    def __init__(self, app, books, users, seed=1):
+        self.app = app
+        self.books = books
+        self.users = users
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._clients = threading.local()
+        self._keys = None
+
+    def _rand(self, a, b):
+        with self._lock:
+            return self.rng.randint(a, b)
+
+    # Клиент потока, вошедший под новым пользователем без рецензий, поэтому каждая
+    # его рецензия действительно добавляется (а не отклоняется как повторная)
+    def _writer(self):
+        client = getattr(self._clients, 'writer', None)
+        if client is None:
+            from models import db, Users
+            login = f'writer-{uuid.uuid4().hex[:12]}'
+            with self.app.app_context():
+                password_hash = db.session.get(Users, 1).hash_pass
+                db.session.add(Users(name='Имя', lastname='Рецензент', login=login, hash_pass=password_hash, id_role=3))
+                db.session.commit()
+            client = self.app.test_client()
+            client.post('/auth/login', data={'login': login, 'password': BENCH_PASSWORD})
+            self._clients.writer = client
+            self._clients.next_book = self.books
+        return client
+
+    def index(self, client):
+        return client.get('/')
+
+    # Ключи сортировки каталога (year, id_book) по убыванию, читаются один раз
+    def _catalog_keys(self):
+        with self._lock:
+            if self._keys is None:
+                from models import db, Books
+                with self.app.app_context():
+                    self._keys = db.session.execute(
+                        db.select(Books.year, Books.id_book).order_by(Books.year.desc(), Books.id_book.desc())
+                    ).all()
+            return self._keys
+
+    # Глубокая страница по курсору, как по ссылке "следующая" из второй половины
+    # каталога: страница начинается после случайной книги
+    def index_deep(self, client):
+        keys = self._catalog_keys()
+        position = self._rand(len(keys) // 2, len(keys) - 1)
+        year, id_book = keys[position]
+        return client.get(f'/?page={position // 9 + 2}&after={year}_{id_book}')
+
+    def index_last(self, client):
+        return client.get('/?page=2&last=1')
+
+    def index_genres(self, client):
+        return client.get(f'/?genre={self._rand(1, 5)}&genre={self._rand(1, 20)}&mode=or')
+
+    def rankings(self, client):
+        return client.get(f"/rankings/{('rating', 'reviews', 'trending')[self._rand(0, 2)]}")
+
+    def search(self, client):
+        return client.get(f'/search?q={WORDS[self._rand(0, len(WORDS) - 1)]}')
+
+    def view_books(self, client):
+        return client.get(f'/books/view_books/{self._rand(1, self.books)}')
+
+    def api_book(self, client):
+        return client.get(f'/api/v1/books/{self._rand(1, self.books)}')
+
+    # Асинхронные версии (async_views.py) для сравнения с синхронными
+    def view_books_async(self, client):
+        return client.get(f'/async/books/view_books/{self._rand(1, self.books)}')
+
+    def api_book_async(self, client):
+        return client.get(f'/async/api/v1/books/{self._rand(1, self.books)}')
+
+    def login(self, client):
+        return client.post('/auth/login', data={'login': f'user{self._rand(2, self.users)}', 'password': BENCH_PASSWORD})
+
+    def write_review(self, client):
+        client = self._writer()
+        id_book = self._clients.next_book
+        self._clients.next_book -= 1
+        return client.post(f'/write_review/{id_book}', data={'rating': '4', 'text': 'Хорошая **книга**'})
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_scenario(app, scenarios, name, requests, threads):
+    action = getattr(scenarios, name)
+    action(app.test_client())
+
+    def request_once(_):
+        client = app.test_client()
+        started = time.perf_counter()
+        response = action(client)
+        elapsed = time.perf_counter() - started
+        return response.status_code, elapsed, query_count(response)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(request_once, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency * 1000 for _, latency, _ in results)
+    errors = sum(1 for status, _, _ in results if status >= 400)
+    return {
+        'requests': requests,
+        'errors': errors,
+        'throughput': round(requests / elapsed, 1),
+        'p50': round(percentile(latencies, 0.50), 2),
+        'p95': round(percentile(latencies, 0.95), 2),
+        'p99': round(percentile(latencies, 0.99), 2),
+        'queries': round(sum(queries for _, _, queries in results) / requests, 2),
+    }
+
+
+# Сравнение с базовыми результатами. Возвращает список описаний регрессий
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None:
+            continue
+        if result['p95'] > base['p95'] * (1 + tolerance / 100):
+            regressions.append(f'{name}: p95 {base["p95"]} -> {result["p95"]} ms')
+        if result['queries'] > base['queries'] + 0.01:
+            regressions.append(f'{name}: queries per request {base["queries"]} -> {result["queries"]}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--database-uri', help='База для прогона (по умолчанию SQLite во временном каталоге)')
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--reviews', type=int, default=200000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=200, help='Запросов на сценарий')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='Запустить только эти сценарии')
+    parser.add_argument('--page-cache', action='store_true', help='Не отключать кэш страниц')
+    parser.add_argument('--baseline', help='Файл с базовыми результатами для сравнения')
+    parser.add_argument('--save-baseline', help='Сохранить результаты как базовые')
+    parser.add_argument('--tolerance', type=float, default=20, help='Допустимый рост p95, %%')
+    args = parser.parse_args()
+    # load_app переходит в каталог app, поэтому пути файлов нужны абсолютные
+    baseline = args.baseline and os.path.abspath(args.baseline)
+    save_baseline = args.save_baseline and os.path.abspath(args.save_baseline)
+
+    database_uri = args.database_uri or 'sqlite:///' + os.path.join(
+        tempfile.gettempdir(), f'catalog-bench-{args.books}-{args.reviews}-{args.users}.db')
+    if not args.page_cache:
+        os.environ['FLASK_PAGE_CACHE_ENABLED'] = 'false'
+    os.environ.setdefault('FLASK_ASYNC_DATABASE', 'true')
+    # Журнал медленных запросов (instrumentation.py) здесь только мешает выводу
+    os.environ.setdefault('FLASK_SLOW_QUERY_MS', '1000000')
+    app = load_app(database_uri)
+    seed(app, args.books, args.reviews, args.users)
+    app.config['PASSWORD_QUEUE_LIMIT'] = args.requests
+
+    results = {}
+    scenarios = Scenarios(app, args.books, args.users)
+    for name in args.scenario or SCENARIOS:
+        result = run_scenario(app, scenarios, name, args.requests, args.threads)
+        results[name] = result
+        print(f'{name:>13}: {result["throughput"]:8.1f} req/s  p50 {result["p50"]:7.2f}  '
+              f'p95 {result["p95"]:7.2f}  p99 {result["p99"]:7.2f} ms  '
+              f'queries {result["queries"]:5.2f}  errors {result["errors"]}')
+
+    report = {
+        'database': database_uri.split(':', 1)[0],
+        'books': args.books,
+        'reviews': args.reviews,
+        'users': args.users,
+        'threads': args.threads,
+        'scenarios': results,
+    }
+    if save_baseline:
+        os.makedirs(os.path.dirname(save_baseline), exist_ok=True)
+        with open(save_baseline, 'w') as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+    if baseline:
+        with open(baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
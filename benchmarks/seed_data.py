@@ -0,0 +1,169 @@
+"""Генератор синтетического каталога для бенчмарков.
+
+Заполняет пустую базу (SQLite или MySQL) книгами, пользователями и рецензиями.
+Распределения приближены к реальным: популярность жанров и книг убывает по
+степенному закону, у большинства книг несколько рецензий, у немногих - тысячи,
+оценки смещены к 4-5. Генератор детерминирован при одинаковом --seed.
+
+    python benchmarks/seed_data.py --database-uri sqlite:////tmp/catalog-bench.db \\
+        --books 100000 --reviews 2000000 --users 5000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+
+GENRES = (
+    'Фантастика', 'Детектив', 'Роман', 'Фэнтези', 'Приключения', 'Классика', 'История',
+    'Биография', 'Психология', 'Научно-популярное', 'Триллер', 'Поэзия', 'Драма',
+    'Ужасы', 'Юмор', 'Бизнес', 'Философия', 'Детская литература', 'Программирование', 'Путешествия',
+)
+WORDS = (
+    'космос', 'драконы', 'сыщик', 'город', 'море', 'война', 'любовь', 'тайна', 'дорога', 'остров',
+    'империя', 'память', 'звезда', 'лес', 'зима', 'письмо', 'машина', 'сад', 'река', 'граница',
+)
+RATINGS = (0, 1, 2, 3, 4, 5)
+RATING_WEIGHTS = (2, 3, 8, 20, 37, 30)
+BENCH_PASSWORD = 'password'
+BATCH_SIZE = 10000
+REVIEWS_START = datetime(2020, 1, 1)
+REVIEWS_PERIOD = 5 * 365 * 24 * 3600
+
+
+def load_app(database_uri):
+    os.environ['FLASK_SQLALCHEMY_DATABASE_URI'] = database_uri
+    os.chdir(APP_DIR)
+    sys.path.insert(0, APP_DIR)
+    from app import app
+    return app
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+# Веса по закону Ципфа: элемент с номером i встречается в ~1/i^s раз реже первого
+def _zipf_weights(count, s=1.1):
+    return [1 / (i + 1) ** s for i in range(count)]
+
+
+def _insert(model, rows):
+    from models import db
+    from sqlalchemy import insert
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(insert(model), rows[start:start + BATCH_SIZE])
+
+
+def seed(app, books, reviews, users, seed=1, log=print):
+    from werkzeug.security import generate_password_hash
+    from models import db, Books, BookStats, ConnectGenreBook, Covers, Genres, Review, Roles, Users
+    from stats import genres_label
+    from search import rebuild_index
+
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    with app.app_context():
+        db.create_all()
+        if db.session.query(Books.id_book).first() is not None:
+            log('database already seeded')
+            return False
+
+        _insert(Roles, [
+            {'id_role': app.config.get('ADMIN_ROLE_ID', 1), 'name_role': 'Администратор', 'description': ''},
+            {'id_role': app.config.get('MODERATOR_ROLE_ID', 2), 'name_role': 'Модератор', 'description': ''},
+            {'id_role': 3, 'name_role': 'Пользователь', 'description': ''},
+        ])
+        _insert(Genres, [{'id_genre': i + 1, 'name_genre': name} for i, name in enumerate(GENRES)])
+        db.session.commit()
+
+        # Пароль у всех пользователей один, хеш считается один раз.
+        # Первый пользователь - администратор
+        password_hash = generate_password_hash(BENCH_PASSWORD, app.config.get('PASSWORD_HASH_METHOD', 'scrypt'))
+        _insert(Users, [
+            {'id_user': i, 'name': 'Имя', 'lastname': f'Фамилия{i}', 'login': f'user{i}', 'hash_pass': password_hash,
+             'id_role': app.config.get('ADMIN_ROLE_ID', 1) if i == 1 else 3}
+            for i in range(1, users + 1)
+        ])
+        _insert(Covers, [
+            {'id_cover': i, 'filename': str(i), 'mimetype': 'jpg', 'md5_hash': f'{i:032x}'}
+            for i in range(1, 101)
+        ])
+        db.session.commit()
+        log(f'users: {users}')
+
+        genre_weights = _zipf_weights(len(GENRES))
+        genre_ids = list(range(1, len(GENRES) + 1))
+        book_genres = {}
+        rows = []
+        for id_book in range(1, books + 1):
+            description = _text(rng, 30)
+            rows.append({
+                'id_book': id_book, 'name_book': _text(rng, 3).capitalize(), 'author': f'Автор {rng.randint(1, books // 5 + 1)}',
+                'publisher': f'Издательство {rng.randint(1, 200)}', 'year': rng.randint(1900, 2025),
+                'pages': rng.randint(50, 1200), 'short_description': description,
+                'short_description_html': f'<p>{description}</p>', 'id_cover': rng.randint(1, 100),
+            })
+            book_genres[id_book] = set(rng.choices(genre_ids, genre_weights, k=rng.randint(1, 3)))
+        _insert(Books, rows)
+        _insert(ConnectGenreBook, [
+            {'id_book': id_book, 'id_genre': id_genre}
+            for id_book, ids in book_genres.items() for id_genre in ids
+        ])
+        db.session.commit()
+        log(f'books: {books}')
+
+        # Число рецензий на книгу пропорционально ее популярности (закон Ципфа
+        # по случайной перестановке книг), не больше числа пользователей
+        order = list(range(1, books + 1))
+        rng.shuffle(order)
+        weights = _zipf_weights(books, 0.8)
+        scale = reviews / sum(weights)
+        stats = {}
+        rows = []
+        id_review = 0
+        for id_book, weight in zip(order, weights):
+            count = min(users, int(weight * scale + rng.random()))
+            ratings = rng.choices(RATINGS, RATING_WEIGHTS, k=count)
+            for id_user, rating in zip(rng.sample(range(1, users + 1), count), ratings):
+                id_review += 1
+                text = _text(rng, 12)
+                rows.append({'id_review': id_review, 'id_book': id_book, 'id_user': id_user, 'rating': rating,
+                             'text': text, 'text_html': f'<p>{text}</p>',
+                             'created_at': REVIEWS_START + timedelta(seconds=rng.randint(0, REVIEWS_PERIOD))})
+            stats[id_book] = (count, sum(ratings))
+            if len(rows) >= BATCH_SIZE * 10:
+                _insert(Review, rows)
+                db.session.commit()
+                rows = []
+        _insert(Review, rows)
+        db.session.commit()
+        log(f'reviews: {id_review}')
+
+        _insert(BookStats, [
+            {'id_book': id_book, 'review_count': count, 'rating_sum': total,
+             'avg_rating': round(total / count, 1) if count else None, 'genres': genres_label(book_genres[id_book])}
+            for id_book, (count, total) in stats.items()
+        ])
+        db.session.commit()
+        rebuild_index()
+    log(f'seeded in {time.perf_counter() - started:.1f} s')
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--database-uri', required=True)
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--reviews', type=int, default=2000000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    seed(load_app(args.database_uri), args.books, args.reviews, args.users, args.seed)
+
+
+if __name__ == '__main__':
+    main()